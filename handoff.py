@@ -0,0 +1,210 @@
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/flaschen_database.db'
+# Lokale Datei, damit die Übergabe nicht über den Netzwerkspeicher des Masters läuft
+HANDOFF_PATH = 'data/handoff.db'
+
+POLL_INTERVAL = 0.2
+# So viele Flaschen hält Station 2 höchstens vorbereitet
+MAX_STAGED = 100
+# Unter diesem Füllstand (Prozent) wird ein Dispenser als knapp gemeldet
+MIN_FILL_LEVEL = 10
+# Vorbereitete Flaschen, die so viele Übergaben hinter der zuletzt abgefüllten liegen
+# oder älter als MAX_STAGED_AGE Sekunden sind, wurden vom Band genommen und werden verworfen
+MAX_STAGED_LAG = 50
+MAX_STAGED_AGE = 600
+
+
+def connect_handoff(path=HANDOFF_PATH):
+    conn = sqlite3.connect(path, timeout=1.0)
+    # WAL, damit Station 1 schreiben kann, während Station 2 liest
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Handoff (
+            Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            Flaschen_ID INTEGER NOT NULL,
+            Tagged_Date INTEGER NOT NULL
+        );
+    """)
+    conn.commit()
+    return conn
+
+
+class HandoffPublisher:
+    """Station 1: meldet jede getaggte Flasche an Station 2."""
+
+    def __init__(self, path=HANDOFF_PATH):
+        self.conn = connect_handoff(path)
+
+    def publish(self, flaschen_id, tagged_date=None):
+        """Ein Fehler der Übergabe darf das Tagging nicht stoppen, Station 2 fragt dann selbst nach."""
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO Handoff (Flaschen_ID, Tagged_Date) VALUES (?, ?);",
+                    (flaschen_id, int(time.time()) if tagged_date is None else tagged_date),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Flasche {flaschen_id} konnte nicht an Station 2 übergeben werden: {e}")
+
+    def close(self):
+        self.conn.close()
+
+
+class StagedBottle:
+    def __init__(self, seq, flaschen_id, rezept, low_dispensers):
+        self.seq = seq
+        self.flaschen_id = flaschen_id
+        self.rezept = rezept
+        self.low_dispensers = low_dispensers
+        self.staged_at = time.time()
+
+
+class RecipePrefetcher:
+    """
+    Station 2: liest die Übergabe im Hintergrund, lädt die Rezepte angekündigter Flaschen vorab
+    und prüft den Füllstand der benötigten Dispenser. get() liefert das Rezept dann ohne Datenbankzugriff.
+    load_rezept(flaschen_id) liefert die Rezeptzeilen (Rezept_ID, Granulat_ID, Menge) oder None.
+    """
+
+    def __init__(self, load_rezept, handoff_path=HANDOFF_PATH, db_path=DB_PATH, poll_interval=POLL_INTERVAL):
+        self.load_rezept = load_rezept
+        self.handoff_path = handoff_path
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.staged = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.out_of_order = 0
+        self.evicted = 0
+        # Seq der zuletzt abgefüllten Flasche
+        self.last_consumed_seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = connect_handoff(handoff_path)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._conn.close()
+
+    def _run(self):
+        conn = connect_handoff(self.handoff_path)
+        last_seq = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    last_seq = self._prefetch(conn, last_seq)
+                except sqlite3.Error as e:
+                    logger.warning(f"Vorabladen fehlgeschlagen: {e}")
+                self._stop.wait(self.poll_interval)
+        finally:
+            conn.close()
+
+    def _prefetch(self, conn, last_seq):
+        with self._lock:
+            self._evict()
+            free = MAX_STAGED - len(self.staged)
+        if free <= 0:
+            return last_seq
+        rows = conn.execute(
+            "SELECT Seq, Flaschen_ID FROM Handoff WHERE Seq > ? ORDER BY Seq LIMIT ?;",
+            (last_seq, free),
+        ).fetchall()
+        if not rows:
+            return last_seq
+
+        fill_levels = self._fill_levels()
+        for seq, flaschen_id in rows:
+            rezept = self.load_rezept(flaschen_id)
+            if rezept:
+                low = sorted({granulat_id for _, granulat_id, _ in rezept
+                              if fill_levels.get(granulat_id, MIN_FILL_LEVEL) < MIN_FILL_LEVEL})
+                if low:
+                    logger.warning(f"Flasche {flaschen_id}: Dispenser {low} fast leer.")
+                with self._lock:
+                    self.staged[flaschen_id] = StagedBottle(seq, flaschen_id, rezept, low)
+        return rows[-1][0]
+
+    def _evict(self):
+        """Verwirft vorbereitete Flaschen, die nicht mehr kommen werden (Aufruf mit gehaltenem Lock)."""
+        oldest = time.time() - MAX_STAGED_AGE
+        for flaschen_id, staged in list(self.staged.items()):
+            if staged.seq < self.last_consumed_seq - MAX_STAGED_LAG or staged.staged_at < oldest:
+                del self.staged[flaschen_id]
+                self.evicted += 1
+                logger.info(f"Vorbereitete Flasche {flaschen_id} verworfen, sie ist nicht angekommen.")
+
+    def _fill_levels(self):
+        """Letzter Füllstand je Dispenser, ein Dispenser gibt das Granulat mit gleicher ID aus."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return dict(conn.execute("""
+                SELECT f.Dispenser_ID, f.Fill_Level FROM Fill_Level f
+                WHERE f.Time = (SELECT MAX(Time) FROM Fill_Level WHERE Dispenser_ID = f.Dispenser_ID);
+            """).fetchall())
+        finally:
+            conn.close()
+
+    def get(self, flaschen_id):
+        """Rezept der gelesenen Flasche: vorbereitet (Treffer) oder direkt aus der Datenbank (Fehlschuss)."""
+        seq = None
+        try:
+            # Abgefüllte und längst übergangene Übergaben löschen, damit die Tabelle nicht wächst
+            with self._conn:
+                seq = self._conn.execute(
+                    "SELECT MAX(Seq) FROM Handoff WHERE Flaschen_ID = ?;", (flaschen_id,)
+                ).fetchone()[0]
+                self._conn.execute("DELETE FROM Handoff WHERE Flaschen_ID = ?;", (flaschen_id,))
+                if seq is not None:
+                    self._conn.execute("DELETE FROM Handoff WHERE Seq < ?;", (seq - MAX_STAGED_LAG,))
+        except sqlite3.Error as e:
+            logger.warning(f"Übergabe von Flasche {flaschen_id} konnte nicht abgeschlossen werden: {e}")
+
+        with self._lock:
+            staged = self.staged.pop(flaschen_id, None)
+            if staged is not None:
+                self.hits += 1
+                seq = staged.seq
+            else:
+                self.misses += 1
+            if seq is not None:
+                # Eine später übergebene Flasche war schon dran: Reihenfolge auf dem Band hat sich geändert
+                if seq < self.last_consumed_seq:
+                    self.out_of_order += 1
+                    logger.info(f"Flasche {flaschen_id} außer der Reihe angekommen.")
+                self.last_consumed_seq = max(self.last_consumed_seq, seq)
+            self._evict()
+
+        if staged is not None:
+            return staged.rezept
+        with self._lock:
+            # Falls der Hintergrund-Thread sie gerade noch vorbereitet hat
+            self.staged.pop(flaschen_id, None)
+        return self.load_rezept(flaschen_id)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "out_of_order": self.out_of_order,
+                "evicted": self.evicted,
+                "staged": len(self.staged),
+            }
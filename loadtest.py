@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from rfid_handler import RFIDHandler
+from simulated_pn532 import SimulatedCard, SimulatedPN532
+from reporting import ensure_dispensed_column
+from replica import init_station_claim
+import provisioning
+import station_1
+import station_2
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/flaschen_database.db'
+
+# Markiert das Ende der Übergabe an Station 2
+STOP = None
+
+
+def percentile(sorted_values, p):
+    """Perzentil nach Nearest-Rank, sorted_values muss aufsteigend sortiert sein."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+class LockedCounter(logging.Handler):
+    """Zählt 'database is locked'-Fehler, die die Stationssoftware selbst abfängt und nur loggt."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.counts = Counter()
+
+    def emit(self, record):
+        if is_locked(record.getMessage()):
+            self.counts[threading.get_ident()] += 1
+
+
+LOCKED_COUNTER = LockedCounter()
+
+
+def attach_locked_counter():
+    """
+    station_1 fängt Datenbankfehler ab, während des Lasttests werden sie nur gezählt statt ausgegeben.
+    Gibt den bisherigen propagate-Wert für detach_locked_counter zurück.
+    """
+    station_1.logger.addHandler(LOCKED_COUNTER)
+    propagate = station_1.logger.propagate
+    station_1.logger.propagate = False
+    return propagate
+
+
+def detach_locked_counter(propagate):
+    station_1.logger.removeHandler(LOCKED_COUNTER)
+    station_1.logger.propagate = propagate
+
+
+def call_retrying(stats, function, *args):
+    """Ruft eine Stationsfunktion auf und wiederholt sie bei 'database is locked'."""
+    while True:
+        try:
+            return function(*args)
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            stats["locked"] += 1
+
+
+def new_stats(kind, index):
+    return {"kind": kind, "index": index, "bottles": 0, "failures": 0, "locked": 0,
+            "tagged_ids": [], "latencies": []}
+
+
+def run_station_1(index, config, handoff, deadline):
+    """Station 1: station_1.write_flaschen_id gegen die Datenbankkopie, je Zyklus eine neue Karte."""
+    stats = new_stats("station_1", index)
+    rng = random.Random(config["seed"] + index)
+    pn532 = SimulatedPN532(config["latency"], config["auth_fail_rate"], config["remove_rate"], seed=rng.random())
+    rfid_handler = RFIDHandler(pn532)
+    locked_before = LOCKED_COUNTER.counts[threading.get_ident()]
+
+    while time.time() < deadline:
+        start = time.perf_counter()
+        card = SimulatedCard.random(rng)
+        pn532.present(card)
+        flaschen_id = station_1.write_flaschen_id(rfid_handler=rfid_handler, db_path=config["db"])
+        if flaschen_id is None:
+            break
+        if flaschen_id is False:
+            stats["failures"] += 1
+            continue
+        stats["latencies"].append(time.perf_counter() - start)
+        stats["bottles"] += 1
+        stats["tagged_ids"].append(flaschen_id)
+        handoff.put(card)
+
+    stats["locked"] = LOCKED_COUNTER.counts[threading.get_ident()] - locked_before
+    return stats
+
+
+def run_station_2(index, config, handoff):
+    """Station 2: Karte lesen, station_2.get_rezept_for_flasche und mark_dispensed gegen die Datenbankkopie."""
+    stats = new_stats("station_2", index)
+    rng = random.Random(config["seed"] + 1000 + index)
+    pn532 = SimulatedPN532(config["latency"], config["auth_fail_rate"], seed=rng.random())
+    rfid_handler = RFIDHandler(pn532)
+
+    while True:
+        card = handoff.get()
+        if card is STOP:
+            break
+        start = time.perf_counter()
+        pn532.present(card)
+        flaschen_id = rfid_handler.read_flaschen_id()
+        if flaschen_id is None:
+            stats["failures"] += 1
+            continue
+
+        rows = call_retrying(stats, station_2.get_rezept_for_flasche, flaschen_id, config["db"])
+        if not rows:
+            stats["failures"] += 1
+            continue
+        call_retrying(stats, station_2.mark_dispensed, flaschen_id, config["db"])
+        stats["latencies"].append(time.perf_counter() - start)
+        stats["bottles"] += 1
+
+    return stats
+
+
+def run_station(kind, index, config, handoff, deadline=None):
+    """Einstiegspunkt für Threads und Prozesse."""
+    if kind == "station_1":
+        return run_station_1(index, config, handoff, deadline)
+    return run_station_2(index, config, handoff)
+
+
+def init_worker():
+    """Worker-Prozesse: print-Ausgaben von RFIDHandler verwerfen, Datenbankfehler von station_1 zählen."""
+    sys.stdout = open(os.devnull, "w")
+    attach_locked_counter()
+
+
+def prepare_database(source, target, bottles):
+    """Kopiert die Datenbank und stellt genug ungetaggte Flaschen bereit."""
+    shutil.copyfile(source, target)
+    conn = sqlite3.connect(target)
+    try:
+        ensure_dispensed_column(conn)
+        init_station_claim(conn)
+        untagged = conn.execute("SELECT COUNT(*) FROM Flasche WHERE Tagged_Date = 0;").fetchone()[0]
+        if untagged < bottles:
+            rezept_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT Rezept_ID FROM Rezept_besteht_aus_Granulat ORDER BY Rezept_ID;")]
+            missing = bottles - untagged
+            # Fehlende Flaschen gleichmäßig auf alle Rezepte verteilen
+            orders = [(rezept_id, missing // len(rezept_ids) + (i < missing % len(rezept_ids)))
+                      for i, rezept_id in enumerate(rezept_ids)]
+            provisioning.provision_orders(conn, [order for order in orders if order[1] > 0])
+    finally:
+        conn.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(results, elapsed):
+    latencies = sorted(latency for stats in results for latency in stats["latencies"])
+    bottles = sum(stats["bottles"] for stats in results)
+    return {
+        "stations": len(results),
+        "bottles": bottles,
+        "bottles_per_second": round(bottles / elapsed, 2) if elapsed else None,
+        "failures": sum(stats["failures"] for stats in results),
+        "database_locked": sum(stats["locked"] for stats in results),
+        "latency_ms": {
+            name: round(percentile(latencies, p) * 1000, 2) if latencies else None
+            for name, p in (("p50", 50), ("p95", 95), ("p99", 99))
+        },
+    }
+
+
+def run_loadtest(config):
+    mode = config["mode"]
+    if mode == "process":
+        manager = multiprocessing.Manager()
+        handoff = manager.Queue()
+        executor = ProcessPoolExecutor(max_workers=config["stations_1"] + config["stations_2"],
+                                       initializer=init_worker)
+    else:
+        manager = None
+        handoff = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=config["stations_1"] + config["stations_2"])
+
+    start = time.perf_counter()
+    deadline = time.time() + config["duration"]
+    propagate = attach_locked_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), executor:
+            futures_1 = [executor.submit(run_station, "station_1", i, config, handoff, deadline)
+                         for i in range(config["stations_1"])]
+            futures_2 = [executor.submit(run_station, "station_2", i, config, handoff)
+                         for i in range(config["stations_2"])]
+            try:
+                results_1 = [future.result() for future in futures_1]
+            finally:
+                # Auch wenn Station 1 abbricht, sonst warten die Station-2-Worker ewig in handoff.get()
+                for _ in futures_2:
+                    handoff.put(STOP)
+            results_2 = [future.result() for future in futures_2]
+    finally:
+        detach_locked_counter(propagate)
+    elapsed = time.perf_counter() - start
+    if manager is not None:
+        manager.shutdown()
+
+    # Flaschen, die mehrere Stationen gleichzeitig ausgewählt und getaggt haben
+    tagged_ids = [flaschen_id for stats in results_1 for flaschen_id in stats["tagged_ids"]]
+    summary_1 = summarize(results_1, elapsed)
+    summary_1["duplicate_claims"] = len(tagged_ids) - len(set(tagged_ids))
+
+    return {
+        "revision": git_revision(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "elapsed_s": round(elapsed, 3),
+        "config": {key: value for key, value in config.items() if key != "db"},
+        "station_1": summary_1,
+        "station_2": summarize(results_2, elapsed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lasttest mit simulierten Stationen und PN532.")
+    parser.add_argument("--db", default=DB_PATH, help="Quelldatenbank, es wird nur eine Kopie verwendet")
+    parser.add_argument("--stations-1", type=int, default=2, help="Anzahl Tagging-Stationen")
+    parser.add_argument("--stations-2", type=int, default=2, help="Anzahl Abfüll-Stationen")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--duration", type=float, default=10, help="Laufzeit von Station 1 in Sekunden")
+    parser.add_argument("--bottles", type=int, default=10000, help="Mindestanzahl ungetaggter Flaschen")
+    parser.add_argument("--auth-fail-rate", type=float, default=0.0)
+    parser.add_argument("--remove-rate", type=float, default=0.0, help="Anteil entfernter Karten beim Schreiben")
+    parser.add_argument("--no-latency", action="store_true", help="PN532 ohne Wartezeiten simulieren")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o", help="Ergebnis als JSON speichern")
+    args = parser.parse_args(argv)
+
+    # Root auf WARNING, damit die Info-Logs der Stationen pro Flasche die Ausgabe nicht fluten
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = os.path.join(tmp, "flaschen_database.db")
+        prepare_database(args.db, db_copy, args.bottles)
+        config = {
+            "db": db_copy,
+            "stations_1": args.stations_1,
+            "stations_2": args.stations_2,
+            "mode": args.mode,
+            "duration": args.duration,
+            "auth_fail_rate": args.auth_fail_rate,
+            "remove_rate": args.remove_rate,
+            "latency": {name: 0 for name in SimulatedPN532().latency} if args.no_latency else None,
+            "seed": args.seed,
+        }
+        logger.info(f"Starte Lasttest: {args.stations_1} x Station 1, {args.stations_2} x Station 2 ({args.mode}).")
+        result = run_loadtest(config)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        logger.info(f"Ergebnis gespeichert in {args.output}")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 import time
 import sqlite3
 import logging
-import board
-import busio
-from digitalio import DigitalInOut
-from adafruit_pn532.spi import PN532_SPI
+import retry_queue
+from rfid_handler import RFIDHandler as BaseRFIDHandler
+from handoff import HandoffPublisher
 
 # Logger konfigurieren
 LOG_FILE = 'station.log'
@@ -22,33 +21,40 @@ logger = logging.getLogger(__name__)
 # Datenbank-Pfad
 DB_PATH = 'data/flaschen_database.db'
 
-# RFID-Handler Klasse
-class RFIDHandler:
-    def __init__(self):
-        spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
-        cs_pin = DigitalInOut(board.D8)
-        self.pn532 = PN532_SPI(spi, cs_pin, debug=False)
-        self.pn532.SAM_configuration()
-        ic, ver, rev, support = self.pn532.firmware_version
-        logger.info(f"PN532 Firmware: {ver}.{rev}")
+# Keine Karte im Feld ist kein Fehlversuch: die Flasche bleibt reserviert, bis eine Karte kommt
+NO_CARD = "Keine Karte erkannt."
+
+# RFID-Handler Klasse: Kartenerkennung (MIFARE Classic/NTAG) aus rfid_handler, hier mit Fehlertexten
+# für die Retry-Queue und Logging statt print
+class RFIDHandler(BaseRFIDHandler):
+    def __init__(self, pn532=None):
+        # Alle PN532-Frames aufzeichnen, z.B. PN532_TRACE=station.trace python main.py
+        super().__init__(pn532)
+        self.last_error = None
 
     def write_id(self, flaschen_id, block_number=1):
-        uid = self.pn532.read_passive_target(timeout=0.5)
-        if uid:
-            logger.info(f"Karte gefunden mit UID: {uid}")
-            key_a = bytes([0xFF] * 6)
-            if self.pn532.mifare_classic_authenticate_block(uid, block_number, 0x60, key_a):
-                data = [0] * 16
-                data[0] = flaschen_id
-                if self.pn532.mifare_classic_write_block(block_number, bytes(data)):
-                    logger.info(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben.")
-                    return True
+        self.last_error = None
+        self.last_uid = None
+        try:
+            uid = self.detect_card(timeout=0.5)
+            if uid:
+                logger.info(f"Karte gefunden mit UID: {uid.hex()} ({self.card_type})")
+                if self.authenticate(uid, block_number):
+                    if self.write_id_block(flaschen_id, block_number):
+                        logger.info(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben.")
+                        return True
+                    else:
+                        self.last_error = "Fehler beim Schreiben auf die Karte."
                 else:
-                    logger.error("Fehler beim Schreiben auf die Karte.")
+                    self.last_error = "Authentifizierung fehlgeschlagen."
             else:
-                logger.error("Authentifizierung fehlgeschlagen.")
-        else:
-            logger.warning("Keine Karte erkannt.")
+                self.last_error = NO_CARD
+                logger.debug(self.last_error)
+                return False
+        except RuntimeError as e:
+            # z.B. Karte während des Schreibens entfernt
+            self.last_error = f"Kommunikationsfehler: {e}"
+        logger.error(self.last_error)
         return False
 
 # State-Machine Klassen
@@ -61,27 +67,44 @@ class State:
 
 class State1(State):
     def run(self):
-        logger.info("State1: Warte auf ungetaggte Flasche in der Datenbank...")
+        if self.machine.previous_state != "State1":
+            logger.info("State1: Warte auf ungetaggte Flasche in der Datenbank...")
+
+        # Die Karte des letzten Versuchs muss erst das Feld verlassen, sonst landet die nächste ID auf ihr
+        wait_uid = self.machine.data.get("wait_uid")
+        if wait_uid is not None:
+            if self.machine.rfid_handler.card_present(wait_uid):
+                return
+            logger.info("Karte entfernt.")
+            self.machine.data["wait_uid"] = None
+
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT Flaschen_ID FROM Flasche WHERE Tagged_Date = 0 LIMIT 1;")
-        result = cursor.fetchone()
+        flaschen_id = retry_queue.next_bottle(conn)
 
-        if result:
-            flaschen_id = result[0]
+        if flaschen_id is not None:
             logger.info(f"Ungetaggte Flasche gefunden: {flaschen_id}")
             self.machine.data["flaschen_id"] = flaschen_id
             self.machine.current_state = "State2"
         else:
-            logger.warning("Keine ungetaggte Flasche gefunden.")
-            self.machine.current_state = "State5"
+            next_due = retry_queue.next_retry_due(conn)
+            if next_due is not None:
+                # Nur noch Wiederholungen offen: bis zur nächsten fälligen warten
+                wait = max(0, next_due - int(time.time()))
+                logger.info(f"Keine neue Flasche, nächste Wiederholung in {wait}s.")
+                time.sleep(wait)
+            else:
+                logger.warning("Keine ungetaggte Flasche gefunden.")
+                self.machine.current_state = "State5"
         conn.close()
 
 class State2(State):
     def run(self):
-        logger.info("State2: Schreibe Flaschen-ID auf die RFID-Karte...")
+        # Auf leerem Band läuft State2 alle 0,5s, der Eintrag wird nur einmal je Flasche geloggt
+        if self.machine.previous_state != "State2":
+            logger.info("State2: Schreibe Flaschen-ID auf die RFID-Karte...")
         flaschen_id = self.machine.data.get("flaschen_id")
-        if flaschen_id and self.machine.rfid_handler.write_id(flaschen_id):
+        rfid_handler = self.machine.rfid_handler
+        if flaschen_id and rfid_handler.write_id(flaschen_id):
             conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
             current_timestamp = int(time.time())
@@ -90,12 +113,27 @@ class State2(State):
                 (current_timestamp, flaschen_id),
             )
             conn.commit()
+            retry_queue.record_success(conn, flaschen_id)
+            # Station 2 kann das Rezept schon laden, bevor die Flasche ankommt
+            self.machine.publisher.publish(flaschen_id, current_timestamp)
             conn.close()
             logger.info(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben und Datenbank aktualisiert.")
+            self.machine.data["wait_uid"] = rfid_handler.last_uid
             self.machine.current_state = "State3"
+        elif rfid_handler.last_error == NO_CARD:
+            # Leeres Band: Flasche behalten und in State2 weiter auf eine Karte warten
+            self.machine.current_state = "State2"
         else:
             logger.error("Fehler beim Schreiben der Flaschen-ID.")
-            self.machine.current_state = "State5"
+            # Flasche in die Retry-Queue. Ein Fehlversuch je aufgelegter Karte: die nächste Flasche
+            # kommt erst, wenn diese Karte entfernt oder eine andere aufgelegt wurde
+            conn = sqlite3.connect(DB_PATH)
+            retry_queue.record_failure(conn, flaschen_id, rfid_handler.last_error)
+            conn.close()
+            self.machine.data["wait_uid"] = rfid_handler.last_uid
+            if rfid_handler.last_uid is not None:
+                logger.info("Warte, bis die Karte entfernt wird.")
+            self.machine.current_state = "State1"
 
 class State3(State):
     def run(self):
@@ -122,7 +160,9 @@ class State4(State):
     def run(self):
         logger.info("State4: Bestätigung senden...")
         logger.info(f"Flasche {self.machine.data['flaschen_id']} erfolgreich verarbeitet.")
-        self.machine.current_state = "State5"
+        if self.machine.data.get("wait_uid") is not None:
+            logger.info("Warte, bis die Karte entfernt wird.")
+        self.machine.current_state = "State1"
 
 class State5(State):
     def run(self):
@@ -134,6 +174,10 @@ class State5(State):
 class StateMachine:
     def __init__(self):
         self.rfid_handler = RFIDHandler()
+        self.publisher = HandoffPublisher()
+        conn = sqlite3.connect(DB_PATH)
+        retry_queue.init_retry_queue(conn)
+        conn.close()
         self.states = {
             "State1": State1(self),
             "State2": State2(self),
@@ -142,13 +186,19 @@ class StateMachine:
             "State5": State5(self),
         }
         self.current_state = "State1"
+        self.previous_state = None
         self.is_running = True
         self.data = {}
 
     def run(self):
-        while self.is_running:
-            state = self.states[self.current_state]
-            state.run()
+        try:
+            while self.is_running:
+                state_name = self.current_state
+                self.states[state_name].run()
+                self.previous_state = state_name
+        finally:
+            self.rfid_handler.close()
+            self.publisher.close()
 
 # Hauptprogramm
 if __name__ == "__main__":  
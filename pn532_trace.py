@@ -0,0 +1,280 @@
+import time
+import struct
+import logging
+import argparse
+
+try:
+    from adafruit_pn532.adafruit_pn532 import PN532 as _PN532Base
+except ImportError:
+    # Ohne adafruit_pn532 (Entwicklungsrechner) die gleichen High-Level-Methoden wie die Simulation
+    from simulated_pn532 import SimulatedPN532 as _PN532Base
+
+logger = logging.getLogger(__name__)
+
+# Dateiformat: Header, danach Einträge aus festem Kopf und Nutzdaten
+MAGIC = b"PN5T"
+VERSION = 1
+HEADER = struct.Struct("<4sBd")      # Magic, Version, Startzeit (Unix)
+RECORD = struct.Struct("<dBBH")      # Zeit seit Start, Art, PN532-Befehl, Länge der Nutzdaten
+
+KIND_COMMAND = 0         # Befehl gesendet, Nutzdaten = Parameter
+KIND_COMMAND_FAILED = 1  # send_command hat False geliefert (kein ACK)
+KIND_RESPONSE = 2        # Antwort erhalten, Nutzdaten = Antwort
+KIND_NO_RESPONSE = 3     # Timeout, keine Antwort
+KIND_ERROR = 4           # Exception beim Lesen der Antwort, Nutzdaten = Fehlermeldung
+KIND_SEND_ERROR = 5      # Exception beim Senden, Nutzdaten = Fehlermeldung
+
+KIND_NAMES = {
+    KIND_COMMAND: "command",
+    KIND_COMMAND_FAILED: "command_failed",
+    KIND_RESPONSE: "response",
+    KIND_NO_RESPONSE: "no_response",
+    KIND_ERROR: "error",
+    KIND_SEND_ERROR: "send_error",
+}
+
+
+class TraceMismatchError(RuntimeError):
+    """Die Stationssoftware sendet einen anderen Befehl als aufgezeichnet."""
+
+
+class TraceExhausted(Exception):
+    """Alle aufgezeichneten Frames wurden abgespielt."""
+
+
+class TraceRecorder:
+    """
+    Schreibt jeden PN532-Befehl und jede Antwort mit Zeitstempel in eine Binärdatei.
+    attach() hängt sich in send_command/process_response (adafruit_pn532) bzw. call_function (Simulation),
+    darüber liegende Methoden wie read_passive_target werden damit vollständig erfasst.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._start = time.perf_counter()
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self.records = 0
+
+    def _write(self, kind, command, payload=b""):
+        payload = bytes(payload)
+        self._file.write(RECORD.pack(time.perf_counter() - self._start, kind, command & 0xFF, len(payload)))
+        self._file.write(payload)
+        self.records += 1
+
+    def _write_result(self, command, call):
+        try:
+            response = call()
+        except Exception as e:
+            self._write(KIND_ERROR, command, str(e).encode("utf-8"))
+            self._file.flush()
+            raise
+        if response is None:
+            self._write(KIND_NO_RESPONSE, command)
+        else:
+            self._write(KIND_RESPONSE, command, response)
+        self._file.flush()
+        return response
+
+    def attach(self, pn532):
+        """Ersetzt die Frame-Methoden der PN532-Instanz durch aufzeichnende Wrapper."""
+        if hasattr(pn532, "send_command") and hasattr(pn532, "process_response"):
+            send_command = pn532.send_command
+            process_response = pn532.process_response
+
+            def recording_send_command(command, params=[], timeout=1):
+                self._write(KIND_COMMAND, command, params)
+                try:
+                    sent = send_command(command, params=params, timeout=timeout)
+                except Exception as e:
+                    self._write(KIND_SEND_ERROR, command, str(e).encode("utf-8"))
+                    self._file.flush()
+                    raise
+                if not sent:
+                    self._write(KIND_COMMAND_FAILED, command)
+                return sent
+
+            def recording_process_response(command, response_length=0, timeout=1):
+                return self._write_result(
+                    command, lambda: process_response(command, response_length=response_length, timeout=timeout)
+                )
+
+            pn532.send_command = recording_send_command
+            pn532.process_response = recording_process_response
+        else:
+            call_function = pn532.call_function
+
+            def recording_call_function(command, response_length=0, params=[], timeout=1):
+                self._write(KIND_COMMAND, command, params)
+                return self._write_result(
+                    command, lambda: call_function(command, response_length=response_length, params=params, timeout=timeout)
+                )
+
+            pn532.call_function = recording_call_function
+        return pn532
+
+    def close(self):
+        self._file.close()
+        logger.info(f"{self.records} Frames nach {self.path} geschrieben.")
+
+
+def read_trace(path):
+    """Liest eine Trace-Datei, gibt (Startzeit, [(Zeit, Art, Befehl, Nutzdaten), ...]) zurück."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, started = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} ist keine PN532-Trace-Datei (Version {VERSION}).")
+
+    records = []
+    offset = HEADER.size
+    # Ein abgebrochener letzter Eintrag (Station hart beendet) wird ignoriert
+    while offset + RECORD.size <= len(data):
+        timestamp, kind, command, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        records.append((timestamp, kind, command, data[offset:offset + length]))
+        offset += length
+    return started, records
+
+
+class ReplayPN532(_PN532Base):
+    """
+    Spielt eine Trace-Datei als PN532 ab. Die High-Level-Methoden (read_passive_target,
+    mifare_classic_*, ...) laufen unverändert, nur die Frames kommen aus der Datei.
+    realtime=True wartet zwischen Befehl und Antwort so lange wie bei der Aufnahme,
+    realtime=False spielt so schnell wie möglich ab und misst nur die Software.
+    """
+
+    def __init__(self, path, realtime=False, strict=False):
+        # Basis-__init__ nicht aufrufen, er würde Reset-Pin und Firmware-Abfrage auslösen
+        self.debug = False
+        self.low_power = False
+        self._irq = None
+        self._reset_pin = None
+        self.realtime = realtime
+        self.strict = strict
+        self.started, self.records = read_trace(path)
+        self.position = 0
+        self._command_sent_at = None
+        self._command_recorded_at = None
+
+    def _next(self, kinds):
+        while self.position < len(self.records):
+            record = self.records[self.position]
+            self.position += 1
+            if record[1] in kinds:
+                return record
+        raise TraceExhausted(f"Trace nach {len(self.records)} Frames zu Ende.")
+
+    def send_command(self, command, params=[], timeout=1):
+        timestamp, kind, recorded_command, payload = self._next((KIND_COMMAND,))
+        if recorded_command != command & 0xFF or (self.strict and payload != bytes(params)):
+            raise TraceMismatchError(
+                f"Frame {self.position - 1}: Befehl 0x{command:02x} {bytes(params).hex()} gesendet, "
+                f"aufgezeichnet 0x{recorded_command:02x} {payload.hex()}"
+            )
+        self._command_sent_at = time.perf_counter()
+        self._command_recorded_at = timestamp
+
+        if self.position < len(self.records):
+            _, next_kind, _, next_payload = self.records[self.position]
+            if next_kind == KIND_COMMAND_FAILED:
+                self.position += 1
+                return False
+            if next_kind == KIND_SEND_ERROR:
+                self.position += 1
+                raise RuntimeError(next_payload.decode("utf-8"))
+        return True
+
+    def process_response(self, command, response_length=0, timeout=1):
+        timestamp, kind, recorded_command, payload = self._next((KIND_RESPONSE, KIND_NO_RESPONSE, KIND_ERROR))
+        if recorded_command != command & 0xFF:
+            raise TraceMismatchError(
+                f"Frame {self.position - 1}: Antwort auf 0x{command:02x} erwartet, aufgezeichnet 0x{recorded_command:02x}"
+            )
+        if self.realtime and self._command_sent_at is not None:
+            # Gerätelatenz der Aufnahme nachbilden, die Softwarezeit läuft echt
+            remaining = (timestamp - self._command_recorded_at) - (time.perf_counter() - self._command_sent_at)
+            if remaining > 0:
+                time.sleep(remaining)
+        if kind == KIND_ERROR:
+            raise RuntimeError(payload.decode("utf-8"))
+        if kind == KIND_NO_RESPONSE:
+            return None
+        return bytearray(payload)
+
+    def call_function(self, command, response_length=0, params=[], timeout=1):
+        if not self.send_command(command, params=params, timeout=timeout):
+            return None
+        return self.process_response(command, response_length=response_length, timeout=timeout)
+
+
+def replay_station(path, station, realtime):
+    """Lässt die Stationslogik von RFIDHandler gegen eine Trace-Datei laufen, bis sie zu Ende ist."""
+    from rfid_handler import RFIDHandler
+
+    pn532 = ReplayPN532(path, realtime=realtime)
+    rfid_handler = RFIDHandler(pn532)
+    durations = []
+    results = []
+    start = time.perf_counter()
+    try:
+        while True:
+            cycle_start = time.perf_counter()
+            try:
+                if station == 1:
+                    # Die ID ist für den Ablauf egal, Parameter werden beim Abspielen nicht verglichen
+                    results.append(rfid_handler.write_flaschen_id(1))
+                else:
+                    results.append(rfid_handler.read_flaschen_id())
+            except TraceMismatchError:
+                raise
+            except RuntimeError as e:
+                # Aufgezeichneter Fehler, z.B. Karte während des Schreibens entfernt
+                results.append(f"Fehler: {e}")
+            durations.append(time.perf_counter() - cycle_start)
+    except TraceExhausted:
+        pass
+    elapsed = time.perf_counter() - start
+
+    recorded = pn532.records[-1][0] - pn532.records[0][0] if pn532.records else 0
+    durations.sort()
+    print(f"{len(durations)} Zyklen in {elapsed * 1000:.1f} ms abgespielt (Aufnahme: {recorded * 1000:.1f} ms).")
+    if durations:
+        print(f"Zyklus p50 {durations[len(durations) // 2] * 1000:.2f} ms, "
+              f"max {durations[-1] * 1000:.2f} ms, Ergebnisse: {results}")
+
+
+def print_trace(path):
+    started, records = read_trace(path)
+    print(f"Aufnahme vom {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}, {len(records)} Frames")
+    for timestamp, kind, command, payload in records:
+        print(f"{timestamp * 1000:10.2f} ms  {KIND_NAMES[kind]:<14} 0x{command:02x}  {payload.hex()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PN532 Trace-Dateien anzeigen und abspielen.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info_parser = subparsers.add_parser("info", help="Frames einer Trace-Datei ausgeben")
+    info_parser.add_argument("trace")
+
+    replay_parser = subparsers.add_parser("replay", help="Trace mit der Stationslogik abspielen")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--station", type=int, choices=[1, 2], default=2,
+                               help="1 = Flaschen-ID schreiben, 2 = Flaschen-ID lesen")
+    replay_parser.add_argument("--realtime", action="store_true", help="Mit aufgezeichneter Gerätelatenz abspielen")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "info":
+        print_trace(args.trace)
+    else:
+        replay_station(args.trace, args.station, args.realtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import csv
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/flaschen_database.db'
+
+
+class ProvisioningError(Exception):
+    """Auftrag kann nicht angelegt werden (Rezept fehlt oder hat keine Granulate)."""
+
+
+def check_rezept(conn, rezept_id):
+    """Prüft das Rezept und gibt die Stückzahl zurück."""
+    row = conn.execute("SELECT Stueckzahl FROM Rezept WHERE Rezept_ID = ?;", (rezept_id,)).fetchone()
+    if row is None:
+        raise ProvisioningError(f"Rezept {rezept_id} existiert nicht.")
+
+    komponenten = conn.execute(
+        "SELECT COUNT(*) FROM Rezept_besteht_aus_Granulat WHERE Rezept_ID = ?;", (rezept_id,)
+    ).fetchone()[0]
+    if komponenten == 0:
+        raise ProvisioningError(f"Rezept {rezept_id} hat keine Granulat-Komponenten.")
+    return row[0]
+
+
+def provision_orders(conn, orders):
+    """
+    Legt Flaschen für mehrere Aufträge [(Rezept_ID, Anzahl oder None), ...] in einer Transaktion an.
+    Ohne Anzahl wird Rezept.Stueckzahl verwendet. Gibt die vergebenen ID-Bereiche zurück.
+    """
+    # Erst alle Aufträge prüfen, damit ein fehlerhaftes Rezept nichts halb anlegt
+    planned = []
+    for rezept_id, anzahl in orders:
+        stueckzahl = check_rezept(conn, rezept_id)
+        anzahl = stueckzahl if anzahl is None else anzahl
+        if anzahl is None or anzahl <= 0:
+            raise ProvisioningError(f"Ungültige Anzahl {anzahl} für Rezept {rezept_id}.")
+        planned.append((rezept_id, anzahl))
+
+    ranges = []
+    try:
+        # BEGIN IMMEDIATE sperrt die Datenbank für andere Schreiber, der ID-Bereich bleibt exklusiv
+        conn.execute("BEGIN IMMEDIATE;")
+        next_id = conn.execute("SELECT COALESCE(MAX(Flaschen_ID), 0) + 1 FROM Flasche;").fetchone()[0]
+        for rezept_id, anzahl in planned:
+            first_id = next_id
+            next_id += anzahl
+            conn.executemany(
+                "INSERT INTO Flasche (Flaschen_ID, Rezept_ID, Tagged_Date, has_error) VALUES (?, ?, 0, 0);",
+                ((flaschen_id, rezept_id) for flaschen_id in range(first_id, next_id)),
+            )
+            ranges.append((rezept_id, first_id, next_id - 1))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+    for rezept_id, first_id, last_id in ranges:
+        logger.info(f"Rezept {rezept_id}: Flaschen {first_id}-{last_id} angelegt.")
+    return ranges
+
+
+def provision_bottles(conn, rezept_id, anzahl=None):
+    """Legt Flaschen für ein einzelnes Rezept an und gibt (erste ID, letzte ID) zurück."""
+    _, first_id, last_id = provision_orders(conn, [(rezept_id, anzahl)])[0]
+    return first_id, last_id
+
+
+def read_orders_csv(path):
+    """Liest Aufträge aus einer CSV mit den Spalten Rezept_ID und optional Anzahl."""
+    orders = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                rezept_id = int(row["Rezept_ID"])
+                anzahl = row.get("Anzahl")
+                orders.append((rezept_id, int(anzahl) if anzahl not in (None, "") else None))
+            except (KeyError, ValueError) as e:
+                raise ProvisioningError(f"{path}:{line_number}: ungültige Zeile {row}: {e}")
+    return orders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flaschen für Produktionsaufträge anlegen.")
+    parser.add_argument("--db", default=DB_PATH, help="Pfad zur SQLite-Datenbank")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--rezept", type=int, help="Rezept_ID des Auftrags")
+    group.add_argument("--csv", help="CSV-Datei mit Aufträgen (Rezept_ID, Anzahl)")
+    parser.add_argument("--anzahl", type=int, help="Anzahl Flaschen (Standard: Rezept.Stueckzahl)")
+    args = parser.parse_args(argv)
+    if args.csv and args.anzahl is not None:
+        parser.error("--anzahl kann nicht zusammen mit --csv verwendet werden, die Anzahl steht in der CSV.")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = None
+    try:
+        # mode=rw: ein vertippter Pfad legt keine leere Datenbank an
+        conn = sqlite3.connect(f"file:{args.db}?mode=rw", uri=True)
+        if args.csv:
+            orders = read_orders_csv(args.csv)
+        else:
+            orders = [(args.rezept, args.anzahl)]
+
+        start = time.perf_counter()
+        ranges = provision_orders(conn, orders)
+        elapsed = time.perf_counter() - start
+        total = sum(last_id - first_id + 1 for _, first_id, last_id in ranges)
+        logger.info(f"{total} Flaschen in {elapsed:.3f}s angelegt ({total / max(elapsed, 1e-9):.0f} Flaschen/s).")
+    except sqlite3.Error as e:
+        logger.error(f"Datenbank {args.db}: {e}")
+        raise SystemExit(1)
+    except (ProvisioningError, OSError) as e:
+        logger.error(str(e))
+        raise SystemExit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import time
+import uuid
+import logging
+import sqlite3
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/flaschen_database.db'
+
+# Wie viele ungetaggte Flaschen eine Station auf Vorrat reserviert
+CLAIM_BATCH = 50
+# Unter diesem lokalen Vorrat reserviert der Sync-Thread nach
+CLAIM_LOW_WATERMARK = 10
+SYNC_BATCH = 500
+SYNC_INTERVAL = 2.0
+# Kurzer Timeout, damit ein langsamer Master die Station nicht blockiert
+MASTER_TIMEOUT = 1.0
+
+LOCAL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS Rezept (
+        Rezept_ID INTEGER PRIMARY KEY,
+        Stueckzahl INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS Rezept_besteht_aus_Granulat (
+        Rezept_ID INTEGER,
+        Granulat_ID INTEGER,
+        Menge FLOAT
+    );
+    CREATE TABLE IF NOT EXISTS Flasche (
+        Flaschen_ID INTEGER PRIMARY KEY,
+        Rezept_ID INTEGER,
+        Tagged_Date DATE,
+        has_error BOOLEAN
+    );
+    CREATE TABLE IF NOT EXISTS Change_Log (
+        Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        Flaschen_ID INTEGER NOT NULL,
+        Spalte TEXT NOT NULL,
+        Wert INTEGER,
+        Created INTEGER NOT NULL,
+        Synced INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS Replica_Info (
+        Replica_ID TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS Sync_Conflict (
+        Seq INTEGER PRIMARY KEY,
+        Flaschen_ID INTEGER NOT NULL,
+        Spalte TEXT NOT NULL,
+        Lokal INTEGER,
+        Master INTEGER,
+        Grund TEXT,
+        Detected INTEGER NOT NULL
+    );
+"""
+
+CLAIM_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS Station_Claim (
+        Flaschen_ID INTEGER PRIMARY KEY,
+        Station_ID TEXT NOT NULL,
+        Claimed INTEGER NOT NULL
+    );
+"""
+
+# Replica_ID statt Station_ID im Schlüssel: eine neu angelegte lokale Datenbank beginnt wieder bei Seq 1
+MASTER_SCHEMA = CLAIM_SCHEMA + """
+    CREATE TABLE IF NOT EXISTS Applied_Change (
+        Replica_ID TEXT NOT NULL,
+        Seq INTEGER NOT NULL,
+        Station_ID TEXT NOT NULL,
+        PRIMARY KEY (Replica_ID, Seq)
+    );
+"""
+
+# Spalten, die eine Station über das Change-Log ändern darf
+SYNCED_COLUMNS = ("Tagged_Date", "has_error")
+
+
+def init_station_claim(conn):
+    """Legt Station_Claim auf dem Master an, damit auch Stationen ohne Kopie reservierte Flaschen auslassen."""
+    conn.executescript(CLAIM_SCHEMA)
+
+
+class StationReplica:
+    """
+    Lokale Kopie der Rezepttabellen und der reservierten Flaschen einer Station.
+    Schreibzugriffe gehen nur in die lokale Datenbank und ins Change-Log,
+    ein Hintergrund-Thread spielt das Log in Batches auf den Master ein.
+    """
+
+    def __init__(self, station_id, local_path, master_path=DB_PATH, master_timeout=MASTER_TIMEOUT):
+        self.station_id = str(station_id)
+        self.local_path = local_path
+        self.master_path = master_path
+        self.master_timeout = master_timeout
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.conn = self._connect_local()
+        self.conn.executescript(LOCAL_SCHEMA)
+        self.replica_id = self._replica_id()
+
+    def _replica_id(self):
+        """Eindeutige ID dieser lokalen Datenbank, wird beim ersten Start erzeugt."""
+        row = self.conn.execute("SELECT Replica_ID FROM Replica_Info;").fetchone()
+        if row:
+            return row[0]
+        replica_id = uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute("INSERT INTO Replica_Info (Replica_ID) VALUES (?);", (replica_id,))
+        logger.info(f"Station {self.station_id}: neue lokale Kopie {replica_id}.")
+        return replica_id
+
+    def _connect_local(self):
+        conn = sqlite3.connect(self.local_path)
+        # WAL, damit der Sync-Thread die Station beim Lesen nicht blockiert
+        conn.execute("PRAGMA journal_mode=WAL;")
+        return conn
+
+    def _connect_master(self):
+        # mode=rw: eine nicht erreichbare Master-Datei wird nicht versehentlich leer angelegt
+        conn = sqlite3.connect(f"file:{self.master_path}?mode=rw", uri=True, timeout=self.master_timeout)
+        conn.executescript(MASTER_SCHEMA)
+        return conn
+
+    # Zugriffe der Station, nur lokal
+
+    def next_bottle(self):
+        """Nächste reservierte, noch ungetaggte und nicht ausgesonderte Flasche oder None."""
+        row = self.conn.execute(
+            "SELECT Flaschen_ID FROM Flasche WHERE Tagged_Date = 0 AND COALESCE(has_error, 0) = 0 "
+            "ORDER BY Flaschen_ID LIMIT 1;"
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_rezept(self, flaschen_id):
+        return self.conn.execute("""
+            SELECT r.Rezept_ID, r.Granulat_ID, r.Menge
+            FROM Rezept_besteht_aus_Granulat r
+            JOIN Flasche f ON r.Rezept_ID = f.Rezept_ID
+            WHERE f.Flaschen_ID = ?;
+        """, (flaschen_id,)).fetchall()
+
+    def mark_tagged(self, flaschen_id, timestamp=None):
+        self._record(flaschen_id, "Tagged_Date", int(time.time()) if timestamp is None else timestamp)
+
+    def set_error(self, flaschen_id, has_error=True):
+        self._record(flaschen_id, "has_error", int(has_error))
+
+    def _record(self, flaschen_id, column, value):
+        """Ändert die lokale Flasche und schreibt die Änderung in derselben Transaktion ins Log."""
+        with self.conn:
+            self.conn.execute(f"UPDATE Flasche SET {column} = ? WHERE Flaschen_ID = ?;", (value, flaschen_id))
+            self.conn.execute(
+                "INSERT INTO Change_Log (Flaschen_ID, Spalte, Wert, Created) VALUES (?, ?, ?, ?);",
+                (flaschen_id, column, value, int(time.time())),
+            )
+
+    def pending_changes(self):
+        return self.conn.execute("SELECT COUNT(*) FROM Change_Log WHERE Synced = 0;").fetchone()[0]
+
+    # Abgleich mit dem Master
+
+    def refresh_recipes(self, local=None):
+        """Überträgt die Rezepttabellen vom Master in die lokale Kopie."""
+        local = local or self.conn
+        master = self._connect_master()
+        try:
+            rezepte = master.execute("SELECT Rezept_ID, Stueckzahl FROM Rezept;").fetchall()
+            komponenten = master.execute(
+                "SELECT Rezept_ID, Granulat_ID, Menge FROM Rezept_besteht_aus_Granulat;"
+            ).fetchall()
+        finally:
+            master.close()
+
+        with local:
+            local.execute("DELETE FROM Rezept;")
+            local.execute("DELETE FROM Rezept_besteht_aus_Granulat;")
+            local.executemany("INSERT INTO Rezept VALUES (?, ?);", rezepte)
+            local.executemany("INSERT INTO Rezept_besteht_aus_Granulat VALUES (?, ?, ?);", komponenten)
+        logger.info(f"Station {self.station_id}: {len(rezepte)} Rezepte vom Master übernommen.")
+
+    def claim_bottles(self, count=CLAIM_BATCH, local=None):
+        """
+        Reserviert ungetaggte Flaschen auf dem Master exklusiv für diese Station. Offene Reservierungen
+        derselben Station_ID werden wieder übernommen, z.B. nach einer neu angelegten lokalen Kopie.
+        """
+        local = local or self.conn
+        master = self._connect_master()
+        try:
+            master.execute("BEGIN IMMEDIATE;")
+            rows = master.execute("""
+                SELECT f.Flaschen_ID, f.Rezept_ID, f.Tagged_Date, f.has_error FROM Flasche f
+                LEFT JOIN Station_Claim c ON c.Flaschen_ID = f.Flaschen_ID
+                WHERE f.Tagged_Date = 0 AND COALESCE(f.has_error, 0) = 0
+                  AND (c.Station_ID IS NULL OR c.Station_ID = ?)
+                ORDER BY f.Flaschen_ID LIMIT ?;
+            """, (self.station_id, count)).fetchall()
+            master.executemany(
+                "INSERT OR IGNORE INTO Station_Claim (Flaschen_ID, Station_ID, Claimed) VALUES (?, ?, ?);",
+                ((row[0], self.station_id, int(time.time())) for row in rows),
+            )
+            master.commit()
+        except sqlite3.Error:
+            master.rollback()
+            raise
+        finally:
+            master.close()
+
+        with local:
+            local.executemany("INSERT OR IGNORE INTO Flasche VALUES (?, ?, ?, ?);", rows)
+        logger.info(f"Station {self.station_id}: {len(rows)} Flaschen reserviert.")
+        return len(rows)
+
+    def release_claims(self):
+        """
+        Gibt die Reservierungen dieser Station für ungetaggte Flaschen auf dem Master frei,
+        z.B. wenn die Station außer Betrieb geht. Vorher muss das Change-Log synchronisiert sein,
+        sonst könnten lokal getaggte Flaschen ein zweites Mal vergeben werden.
+        """
+        master = self._connect_master()
+        try:
+            master.execute("BEGIN IMMEDIATE;")
+            released = [row[0] for row in master.execute("""
+                SELECT c.Flaschen_ID FROM Station_Claim c JOIN Flasche f ON f.Flaschen_ID = c.Flaschen_ID
+                WHERE c.Station_ID = ? AND f.Tagged_Date = 0;
+            """, (self.station_id,))]
+            master.executemany("DELETE FROM Station_Claim WHERE Flaschen_ID = ?;", ((fid,) for fid in released))
+            master.commit()
+        except sqlite3.Error:
+            master.rollback()
+            raise
+        finally:
+            master.close()
+
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM Flasche WHERE Flaschen_ID = ? AND Tagged_Date = 0;", ((fid,) for fid in released)
+            )
+        logger.info(f"Station {self.station_id}: {len(released)} Reservierungen freigegeben.")
+        return len(released)
+
+    def sync_once(self, batch_size=SYNC_BATCH, local=None):
+        """
+        Spielt einen Batch des Change-Logs auf den Master ein. Bereits übernommene Einträge
+        (Replica_ID, Seq) werden übersprungen, ein erneuter Lauf nach Abbruch ist daher harmlos.
+        Gibt die Anzahl verarbeiteter Einträge zurück.
+        """
+        local = local or self.conn
+        changes = local.execute(
+            "SELECT Seq, Flaschen_ID, Spalte, Wert FROM Change_Log WHERE Synced = 0 ORDER BY Seq LIMIT ?;",
+            (batch_size,),
+        ).fetchall()
+        if not changes:
+            return 0
+
+        conflicts = []
+        master = self._connect_master()
+        try:
+            master.execute("BEGIN IMMEDIATE;")
+            for seq, flaschen_id, column, value in changes:
+                applied = master.execute(
+                    "INSERT OR IGNORE INTO Applied_Change (Replica_ID, Seq, Station_ID) VALUES (?, ?, ?);",
+                    (self.replica_id, seq, self.station_id),
+                ).rowcount
+                if not applied:
+                    continue
+                conflict = self._check_conflict(master, flaschen_id, column, value)
+                if conflict:
+                    conflicts.append((seq, flaschen_id, column, value) + conflict)
+                    continue
+                master.execute(f"UPDATE Flasche SET {column} = ? WHERE Flaschen_ID = ?;", (value, flaschen_id))
+            master.commit()
+        except sqlite3.Error:
+            master.rollback()
+            raise
+        finally:
+            master.close()
+
+        now = int(time.time())
+        with local:
+            local.executemany(
+                "UPDATE Change_Log SET Synced = 1 WHERE Seq = ?;", ((change[0],) for change in changes)
+            )
+            local.executemany(
+                "INSERT OR REPLACE INTO Sync_Conflict VALUES (?, ?, ?, ?, ?, ?, ?);",
+                (conflict + (now,) for conflict in conflicts),
+            )
+        for seq, flaschen_id, column, value, master_value, reason in conflicts:
+            logger.warning(f"Konflikt bei Flasche {flaschen_id} ({column}): lokal {value}, Master {master_value}, {reason}")
+        logger.info(f"Station {self.station_id}: {len(changes)} Änderungen synchronisiert, {len(conflicts)} Konflikte.")
+        return len(changes)
+
+    def _check_conflict(self, master, flaschen_id, column, value):
+        """Gibt (Master-Wert, Grund) zurück, wenn die Änderung nicht übernommen werden darf."""
+        if column not in SYNCED_COLUMNS:
+            return None, "Spalte nicht synchronisierbar"
+        row = master.execute(
+            f"SELECT f.{column}, c.Station_ID FROM Flasche f "
+            "LEFT JOIN Station_Claim c ON c.Flaschen_ID = f.Flaschen_ID WHERE f.Flaschen_ID = ?;",
+            (flaschen_id,),
+        ).fetchone()
+        if row is None:
+            return None, "Flasche existiert nicht auf dem Master"
+        master_value, owner = row
+        if owner is not None and owner != self.station_id:
+            return master_value, f"reserviert von Station {owner}"
+        if column == "Tagged_Date" and master_value not in (0, None, value):
+            return master_value, "bereits getaggt"
+        return None
+
+    # Hintergrund-Synchronisation
+
+    def start_sync(self, interval=SYNC_INTERVAL):
+        """Startet den Sync-Thread; er synchronisiert das Log und hält den Flaschenvorrat aufgefüllt."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sync_loop, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop_sync(self, flush=True):
+        """Beendet den Sync-Thread, auf Wunsch nach einem letzten Abgleich."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            try:
+                while self.sync_once():
+                    pass
+            except sqlite3.Error as e:
+                logger.warning(f"Station {self.station_id}: Master nicht erreichbar, {self.pending_changes()} Änderungen bleiben lokal: {e}")
+
+    def _sync_loop(self, interval):
+        local = self._connect_local()
+        try:
+            while not self._stop.is_set():
+                try:
+                    while self.sync_once(local=local) == SYNC_BATCH:
+                        pass
+                    stock = local.execute(
+                        "SELECT COUNT(*) FROM Flasche WHERE Tagged_Date = 0 AND COALESCE(has_error, 0) = 0;"
+                    ).fetchone()[0]
+                    if stock < CLAIM_LOW_WATERMARK:
+                        self.claim_bottles(local=local)
+                except sqlite3.Error as e:
+                    # Master langsam oder nicht erreichbar: Station arbeitet lokal weiter
+                    logger.warning(f"Station {self.station_id}: Sync fehlgeschlagen, neuer Versuch in {interval}s: {e}")
+                self._stop.wait(interval)
+        finally:
+            local.close()
+
+    def close(self, flush=True):
+        self.stop_sync(flush)
+        self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lokale Stationskopie der Flaschen-Datenbank verwalten.")
+    parser.add_argument("station_id")
+    parser.add_argument("--local", help="Lokale Datenbank (Standard: data/station_<ID>.db)")
+    parser.add_argument("--master", default=DB_PATH)
+    parser.add_argument("command", choices=["init", "sync", "status", "release"])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    replica = StationReplica(args.station_id, args.local or f"data/station_{args.station_id}.db", args.master)
+    try:
+        if args.command == "init":
+            replica.refresh_recipes()
+            replica.claim_bottles()
+        elif args.command == "sync":
+            while replica.sync_once():
+                pass
+        elif args.command == "release":
+            while replica.sync_once():
+                pass
+            if replica.pending_changes():
+                logger.error(f"Station {args.station_id}: Change-Log nicht vollständig synchronisiert, nichts freigegeben.")
+                raise SystemExit(1)
+            replica.release_claims()
+        conflicts = replica.conn.execute("SELECT COUNT(*) FROM Sync_Conflict;").fetchone()[0]
+        stock = replica.conn.execute("SELECT COUNT(*) FROM Flasche WHERE Tagged_Date = 0;").fetchone()[0]
+        print(f"Station {args.station_id}: {stock} Flaschen auf Vorrat, "
+              f"{replica.pending_changes()} offene Änderungen, {conflicts} Konflikte.")
+    finally:
+        replica.close(flush=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+import sys
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/flaschen_database.db'
+
+# Anzahl Zeilen, die pro fetchmany() aus dem Cursor geholt werden
+CHUNK_SIZE = 1000
+
+# Aggregationen laufen komplett in SQLite, Python sieht nur die Ergebniszeilen
+REPORTS = {
+    "bottles": (
+        ["Flaschen_ID", "Rezept_ID", "Tagged_Date", "has_error"],
+        "SELECT Flaschen_ID, Rezept_ID, Tagged_Date, has_error FROM Flasche ORDER BY Flaschen_ID;",
+    ),
+    "tagged-per-hour": (
+        ["Stunde", "Anzahl"],
+        """
+        SELECT strftime('%Y-%m-%d %H:00', Tagged_Date, 'unixepoch') AS Stunde, COUNT(*) AS Anzahl
+        FROM Flasche
+        WHERE Tagged_Date > 0
+        GROUP BY Stunde
+        ORDER BY Stunde;
+        """,
+    ),
+    "error-rate": (
+        ["Rezept_ID", "Flaschen", "Fehler", "Fehlerquote"],
+        """
+        SELECT Rezept_ID,
+               COUNT(*) AS Flaschen,
+               SUM(COALESCE(has_error, 0) != 0) AS Fehler,
+               ROUND(AVG(COALESCE(has_error, 0) != 0), 4) AS Fehlerquote
+        FROM Flasche
+        GROUP BY Rezept_ID
+        ORDER BY Rezept_ID;
+        """,
+    ),
+    "dispense-latency": (
+        ["Rezept_ID", "Flaschen", "Min_s", "Avg_s", "Max_s"],
+        """
+        SELECT Rezept_ID,
+               COUNT(*) AS Flaschen,
+               MIN(Dispensed_Date - Tagged_Date) AS Min_s,
+               ROUND(AVG(Dispensed_Date - Tagged_Date), 1) AS Avg_s,
+               MAX(Dispensed_Date - Tagged_Date) AS Max_s
+        FROM Flasche
+        WHERE Tagged_Date > 0 AND Dispensed_Date > 0
+        GROUP BY Rezept_ID
+        ORDER BY Rezept_ID;
+        """,
+    ),
+}
+
+
+def has_column(conn, table, column):
+    """Prüft, ob eine Tabelle eine bestimmte Spalte hat."""
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table});"))
+
+
+def ensure_dispensed_column(conn):
+    """Rüstet Flasche.Dispensed_Date bei älteren Datenbanken einmalig nach."""
+    if not has_column(conn, "Flasche", "Dispensed_Date"):
+        conn.execute("ALTER TABLE Flasche ADD COLUMN Dispensed_Date DATE DEFAULT 0;")
+        conn.commit()
+
+
+def stream_rows(cursor, chunk_size=CHUNK_SIZE):
+    """Liefert die Zeilen eines Cursors blockweise, ohne die ganze Tabelle zu laden."""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def run_report(conn, name, chunk_size=CHUNK_SIZE):
+    """Führt einen Report aus und gibt (Spaltennamen, Zeilen-Generator) zurück."""
+    columns, query = REPORTS[name]
+    if name == "dispense-latency" and not has_column(conn, "Flasche", "Dispensed_Date"):
+        logger.warning("Spalte Dispensed_Date fehlt, Station 2 hat noch keine Flasche abgefüllt.")
+        return columns, iter(())
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return columns, stream_rows(cursor, chunk_size)
+
+
+def write_csv(columns, rows, out):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(columns, rows, out):
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row))) + "\n")
+        count += 1
+    return count
+
+
+WRITERS = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+}
+
+
+def update_has_error_batch(conn, flaschen_ids, has_error=True):
+    """Setzt has_error für viele Flaschen in einer einzigen Transaktion."""
+    try:
+        with conn:
+            cursor = conn.executemany(
+                "UPDATE Flasche SET has_error = ? WHERE Flaschen_ID = ?;",
+                ((int(has_error), flaschen_id) for flaschen_id in flaschen_ids),
+            )
+        logger.info(f"has_error für {cursor.rowcount} Flaschen auf {has_error} gesetzt.")
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"Fehler beim Setzen von has_error: {e}")
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports über die Flaschen-Datenbank.")
+    parser.add_argument("--db", default=DB_PATH, help="Pfad zur SQLite-Datenbank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = subparsers.add_parser("report", help="Report als CSV oder JSON Lines ausgeben")
+    report_parser.add_argument("name", choices=sorted(REPORTS))
+    report_parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    report_parser.add_argument("--output", "-o", help="Ausgabedatei (Standard: stdout)")
+    report_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    error_parser = subparsers.add_parser("set-error", help="has_error für mehrere Flaschen setzen")
+    error_parser.add_argument("flaschen_ids", nargs="+", type=int)
+    error_parser.add_argument("--clear", action="store_true", help="has_error zurücksetzen")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == "report":
+            columns, rows = run_report(conn, args.name, args.chunk_size)
+            if args.output:
+                with open(args.output, "w", newline="", encoding="utf-8") as out:
+                    count = WRITERS[args.format](columns, rows, out)
+            else:
+                count = WRITERS[args.format](columns, rows, sys.stdout)
+            logger.info(f"Report {args.name}: {count} Zeilen geschrieben.")
+        elif args.command == "set-error":
+            update_has_error_batch(conn, args.flaschen_ids, not args.clear)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import time
+import logging
+
+from replica import init_station_claim
+
+logger = logging.getLogger(__name__)
+
+# Nach so vielen Fehlversuchen landet eine Flasche im Dead-Letter-Zustand
+MAX_ATTEMPTS = 3
+# Wartezeit vor dem nächsten Versuch: BACKOFF_BASE * 2^(Versuche-1), maximal BACKOFF_MAX Sekunden
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+
+def init_retry_queue(conn):
+    """Legt die Retry-Tabelle (und Station_Claim für next_bottle) an, falls sie noch nicht existieren."""
+    init_station_claim(conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Retry_Queue (
+            Flaschen_ID INTEGER PRIMARY KEY,
+            Attempts INTEGER NOT NULL,
+            Next_Attempt INTEGER NOT NULL,
+            Status TEXT NOT NULL,
+            Last_Error TEXT,
+            FOREIGN KEY (Flaschen_ID) REFERENCES Flasche (Flaschen_ID)
+        );
+    """)
+    conn.commit()
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def next_bottle(conn, now=None):
+    """
+    Nächste Flasche für Station 1: zuerst fällige Wiederholungen, dann ungetaggte Flaschen,
+    die weder in der Retry-Queue stehen noch von einer Station mit lokaler Kopie reserviert sind.
+    """
+    now = int(time.time()) if now is None else now
+    row = conn.execute("""
+        SELECT Flaschen_ID FROM Retry_Queue
+        WHERE Status = ? AND Next_Attempt <= ?
+        ORDER BY Next_Attempt LIMIT 1;
+    """, (STATUS_PENDING, now)).fetchone()
+    if row:
+        return row[0]
+
+    row = conn.execute("""
+        SELECT f.Flaschen_ID FROM Flasche f
+        WHERE f.Tagged_Date = 0
+          AND NOT EXISTS (SELECT 1 FROM Retry_Queue q WHERE q.Flaschen_ID = f.Flaschen_ID)
+          AND NOT EXISTS (SELECT 1 FROM Station_Claim c WHERE c.Flaschen_ID = f.Flaschen_ID)
+        LIMIT 1;
+    """).fetchone()
+    return row[0] if row else None
+
+
+def next_retry_due(conn):
+    """Zeitpunkt der nächsten fälligen Wiederholung oder None, wenn keine aussteht."""
+    row = conn.execute(
+        "SELECT MIN(Next_Attempt) FROM Retry_Queue WHERE Status = ?;", (STATUS_PENDING,)
+    ).fetchone()
+    return row[0]
+
+
+def record_failure(conn, flaschen_id, error, now=None):
+    """
+    Zählt einen Fehlversuch. Nach MAX_ATTEMPTS wird die Flasche als dead markiert
+    und has_error in Flasche gesetzt. Gibt den neuen Status zurück.
+    """
+    now = int(time.time()) if now is None else now
+    row = conn.execute("SELECT Attempts FROM Retry_Queue WHERE Flaschen_ID = ?;", (flaschen_id,)).fetchone()
+    attempts = (row[0] if row else 0) + 1
+
+    with conn:
+        if attempts >= MAX_ATTEMPTS:
+            status = STATUS_DEAD
+            conn.execute("UPDATE Flasche SET has_error = 1 WHERE Flaschen_ID = ?;", (flaschen_id,))
+        else:
+            status = STATUS_PENDING
+        conn.execute("""
+            INSERT INTO Retry_Queue (Flaschen_ID, Attempts, Next_Attempt, Status, Last_Error)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (Flaschen_ID) DO UPDATE SET
+                Attempts = excluded.Attempts,
+                Next_Attempt = excluded.Next_Attempt,
+                Status = excluded.Status,
+                Last_Error = excluded.Last_Error;
+        """, (flaschen_id, attempts, now + backoff(attempts), status, error))
+
+    if status == STATUS_DEAD:
+        logger.error(f"Flasche {flaschen_id} nach {attempts} Versuchen in Dead-Letter verschoben: {error}")
+    else:
+        logger.warning(f"Flasche {flaschen_id} Versuch {attempts} fehlgeschlagen, neuer Versuch in {backoff(attempts)}s: {error}")
+    return status
+
+
+def record_success(conn, flaschen_id):
+    """Entfernt eine erfolgreich getaggte Flasche aus der Retry-Queue."""
+    with conn:
+        conn.execute("DELETE FROM Retry_Queue WHERE Flaschen_ID = ?;", (flaschen_id,))
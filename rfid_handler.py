@@ -1,14 +1,33 @@
-import board
-import busio
-from digitalio import DigitalInOut
-from adafruit_pn532.spi import PN532_SPI
+import os
+from pn532_trace import TraceRecorder
+
+# Flaschen-ID steht little-endian in den ersten 4 Bytes des Blocks.
+# Alte Karten mit der ID nur im ersten Byte werden dadurch weiterhin korrekt gelesen.
+FLASCHEN_ID_BYTES = 4
+
+# PN532 InListPassiveTarget, direkt aufgerufen, um ATQA/SAK auszuwerten (wie src/nfc_reader.py)
+_COMMAND_INLISTPASSIVETARGET = 0x4A
+
+CARD_MIFARE_CLASSIC = "mifare_classic"
+CARD_NTAG = "ntag"
+# NTAG21x: die Flaschen-ID steht in der ersten Nutzerseite, eine Seite hat genau FLASCHEN_ID_BYTES
+NTAG_ID_PAGE = 4
 
 class RFIDHandler:
-    def __init__(self):
-        # SPI-Verbindung initialisieren
-        spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
-        cs_pin = DigitalInOut(board.D8)  # CS-Pin definieren
-        self.pn532 = PN532_SPI(spi, cs_pin, debug=False)
+    def __init__(self, pn532=None, trace_path=None):
+        if pn532 is None:
+            pn532 = self._connect_spi()
+        self.pn532 = pn532
+        # UID der Karte aus dem letzten Lese- oder Schreibversuch, None ohne Karte
+        self.last_uid = None
+        self.card_type = CARD_MIFARE_CLASSIC
+
+        # Alle PN532-Frames aufzeichnen, z.B. PN532_TRACE=station2.trace python station_2.py
+        trace_path = trace_path or os.environ.get("PN532_TRACE")
+        self.trace_recorder = None
+        if trace_path:
+            self.trace_recorder = TraceRecorder(trace_path)
+            self.trace_recorder.attach(self.pn532)
 
         # Firmware-Version ausgeben
         ic, ver, rev, support = self.pn532.firmware_version
@@ -17,6 +36,66 @@ class RFIDHandler:
         # Konfiguration für MiFare-Karten
         self.pn532.SAM_configuration()
 
+    def close(self):
+        """Schließt die Trace-Datei, falls aufgezeichnet wird."""
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+            self.trace_recorder = None
+
+    @staticmethod
+    def _connect_spi():
+        """Öffnet den PN532 am SPI-Bus (Hardware-Bibliotheken nur hier, damit Simulationen ohne sie laufen)."""
+        import board
+        import busio
+        from digitalio import DigitalInOut
+        from adafruit_pn532.spi import PN532_SPI
+
+        # SPI-Verbindung initialisieren
+        spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
+        cs_pin = DigitalInOut(board.D8)  # CS-Pin definieren
+        return PN532_SPI(spi, cs_pin, debug=False)
+
+    def detect_card(self, timeout=1):
+        """
+        Wie read_passive_target, wertet aber zusätzlich ATQA/SAK aus und setzt card_type
+        (NTAG21x oder MIFARE Classic). Gibt die UID oder None zurück.
+        """
+        response = self.pn532.call_function(
+            _COMMAND_INLISTPASSIVETARGET, params=[0x01, 0x00], response_length=19, timeout=timeout
+        )
+        if response is None or response[0] != 0x01:
+            self.last_uid = None
+            return None
+        atqa = (response[2] << 8) | response[3]
+        sak = response[4]
+        self.card_type = CARD_NTAG if sak == 0x00 and atqa == 0x0044 else CARD_MIFARE_CLASSIC
+        self.last_uid = bytes(response[6:6 + response[5]])
+        return self.last_uid
+
+    def authenticate(self, uid, block_number):
+        """MIFARE Classic braucht Key A für den Block, NTAG-Seiten sind ohne Authentifizierung lesbar."""
+        if self.card_type == CARD_NTAG:
+            return True
+        key_a = bytes([0xFF] * 6)  # Standard-Key A
+        return self.pn532.mifare_classic_authenticate_block(
+            uid=uid, block_number=block_number, key_number=0x60, key=key_a
+        )
+
+    def read_id_block(self, block_number):
+        """Liest die Bytes mit der Flaschen-ID: Block block_number (MIFARE) bzw. Seite NTAG_ID_PAGE (NTAG)."""
+        if self.card_type == CARD_NTAG:
+            return self.pn532.ntag2xx_read_block(NTAG_ID_PAGE)
+        return self.pn532.mifare_classic_read_block(block_number)
+
+    def write_id_block(self, flaschen_id, block_number):
+        """Schreibt die Flaschen-ID in Block block_number (MIFARE) bzw. Seite NTAG_ID_PAGE (NTAG)."""
+        id_bytes = flaschen_id.to_bytes(FLASCHEN_ID_BYTES, byteorder='little')
+        if self.card_type == CARD_NTAG:
+            return self.pn532.ntag2xx_write_block(NTAG_ID_PAGE, id_bytes)
+        data = bytearray(16)  # 16-Byte Block
+        data[:FLASCHEN_ID_BYTES] = id_bytes
+        return self.pn532.mifare_classic_write_block(block_number, bytes(data))
+
     def read_uid(self):
         """Liest die UID der RFID-Karte."""
         uid = self.pn532.read_passive_target(timeout=1)
@@ -24,27 +103,36 @@ class RFIDHandler:
             return int.from_bytes(uid, byteorder='big')
         return None
 
+    def card_present(self, uid):
+        """True, solange die Karte mit dieser UID im Feld liegt. Eine andere Karte zählt als entfernt."""
+        try:
+            current = self.pn532.read_passive_target(timeout=0.5)
+        except RuntimeError:
+            # Im Zweifel als noch vorhanden werten, sonst würde die Karte überschrieben
+            return True
+        return current is not None and bytes(current) == uid
+
+    def wait_for_removal(self, uid):
+        """Blockiert, bis die Karte das Feld verlassen hat oder eine andere Karte aufgelegt wurde."""
+        while self.card_present(uid):
+            pass
+
     def read_flaschen_id(self, block_number=1):
         """Liest die Flaschen-ID aus einem Block der Karte."""
-        key_a = bytes([0xFF] * 6)  # Standard-Key A
-
-        uid = self.pn532.read_passive_target(timeout=1)
+        uid = self.detect_card(timeout=1)
         if not uid:
             print("Keine Karte erkannt.")
             return None
 
         # Authentifizierung
-        authenticated = self.pn532.mifare_classic_authenticate_block(
-            uid=uid, block_number=block_number, key_number=0x60, key=key_a
-        )
-        if not authenticated:
+        if not self.authenticate(uid, block_number):
             print("Authentifizierung fehlgeschlagen.")
             return None
 
         # Block auslesen
-        data = self.pn532.mifare_classic_read_block(block_number)
+        data = self.read_id_block(block_number)
         if data:
-            flaschen_id = data[0]  # Flaschen-ID aus dem ersten Byte extrahieren
+            flaschen_id = int.from_bytes(data[:FLASCHEN_ID_BYTES], byteorder='little')
             return flaschen_id
         else:
             print("Fehler beim Lesen des Blocks.")
@@ -52,25 +140,18 @@ class RFIDHandler:
 
     def write_flaschen_id(self, flaschen_id, block_number=1):
         """Schreibt die Flaschen-ID auf die Karte."""
-        key_a = bytes([0xFF] * 6)  # Standard-Key A
-
-        uid = self.pn532.read_passive_target(timeout=0.5)
+        uid = self.detect_card(timeout=0.5)
         if not uid:
             print("Keine Karte erkannt.")
             return False
 
         # Authentifizierung
-        authenticated = self.pn532.mifare_classic_authenticate_block(
-            uid=uid, block_number=block_number, key_number=0x60, key=key_a
-        )
-        if not authenticated:
+        if not self.authenticate(uid, block_number):
             print("Authentifizierung fehlgeschlagen.")
             return False
 
         # Schreiben der Flaschen-ID
-        data = [0] * 16  # 16-Byte Block
-        data[0] = flaschen_id
-        success = self.pn532.mifare_classic_write_block(block_number, bytes(data))
+        success = self.write_id_block(flaschen_id, block_number)
 
         if success:
             print(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben.")
@@ -0,0 +1,215 @@
+import time
+import random
+import threading
+
+# PN532 Befehle und Karten-Kommandos, wie in adafruit_pn532
+_COMMAND_GETFIRMWAREVERSION = 0x02
+_COMMAND_SAMCONFIGURATION = 0x14
+_COMMAND_INDATAEXCHANGE = 0x40
+_COMMAND_INLISTPASSIVETARGET = 0x4A
+MIFARE_CMD_AUTH_A = 0x60
+MIFARE_CMD_AUTH_B = 0x61
+MIFARE_CMD_READ = 0x30
+MIFARE_CMD_WRITE = 0xA0
+NTAG_CMD_GET_VERSION = 0x60
+NTAG_CMD_FAST_READ = 0x3A
+NTAG_CMD_WRITE = 0xA2
+
+# Typische Zeiten eines PN532 über SPI in Sekunden
+DEFAULT_LATENCY = {
+    "read_passive_target": 0.030,
+    "authenticate": 0.005,
+    "read_block": 0.005,
+    "write_block": 0.012,
+    # Zusätzliche Übertragungszeit je Antwortbyte über 16 Byte (FAST_READ)
+    "per_byte": 0.00008,
+}
+
+
+class SimulatedCard:
+    """MIFARE Classic 1K Karte mit 64 Blöcken à 16 Byte."""
+
+    BLOCK_COUNT = 64
+    ATQA = 0x0004
+    SAK = 0x08
+
+    def __init__(self, uid, blocks=None):
+        self.uid = bytes(uid)
+        self.blocks = blocks if blocks is not None else [bytes(16) for _ in range(self.BLOCK_COUNT)]
+
+    @classmethod
+    def random(cls, rng=random):
+        return cls(bytes(rng.randrange(256) for _ in range(4)))
+
+
+class SimulatedNtagCard:
+    """NTAG21x Karte mit 4-Byte-Seiten, ohne Authentifizierung."""
+
+    ATQA = 0x0044
+    SAK = 0x00
+    # Seitenanzahl und Speichergröße aus GET_VERSION je Typ
+    TYPES = {
+        "ntag213": (45, 0x0F),
+        "ntag215": (135, 0x11),
+        "ntag216": (231, 0x13),
+    }
+
+    def __init__(self, uid, card_type="ntag215", pages=None):
+        self.uid = bytes(uid)
+        self.card_type = card_type
+        page_count, self.storage_size = self.TYPES[card_type]
+        self.pages = pages if pages is not None else [bytes(4) for _ in range(page_count)]
+
+    @classmethod
+    def random(cls, rng=random, card_type="ntag215"):
+        return cls(bytes([0x04]) + bytes(rng.randrange(256) for _ in range(6)), card_type)
+
+    def read(self, page):
+        """READ liefert 4 Seiten ab page, am Speicherende wird wie bei echten Tags umgebrochen."""
+        return b"".join(self.pages[(page + i) % len(self.pages)] for i in range(4))
+
+
+class SimulatedPN532:
+    """
+    Ersatz für PN532_SPI ohne Hardware. Liefert dieselben Methoden, die RFIDHandler und
+    NFCReader verwenden, mit konfigurierbaren Latenzen und Fehlerraten.
+    Alle Kartenzugriffe laufen wie bei adafruit_pn532 über call_function, exchanges zählt die Frames.
+    """
+
+    def __init__(self, latency=None, auth_fail_rate=0.0, remove_rate=0.0, seed=None):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.auth_fail_rate = auth_fail_rate
+        self.remove_rate = remove_rate
+        self.rng = random.Random(seed)
+        self.card = None
+        self.exchanges = 0
+        self._authenticated = None
+        self._lock = threading.Lock()
+
+    def _wait(self, operation, extra_bytes=0):
+        delay = self.latency.get(operation, 0) + self.latency.get("per_byte", 0) * extra_bytes
+        if delay:
+            time.sleep(delay)
+
+    def present(self, card):
+        """Karte ins Feld legen (None entfernt die Karte)."""
+        with self._lock:
+            self.card = card
+            self._authenticated = None
+
+    def call_function(self, command, response_length=0, params=[], timeout=1):
+        self.exchanges += 1
+        if command == _COMMAND_GETFIRMWAREVERSION:
+            return bytearray([0x32, 0x01, 0x06, 0x07])
+        if command == _COMMAND_SAMCONFIGURATION:
+            return bytearray()
+        if command == _COMMAND_INLISTPASSIVETARGET:
+            self._wait("read_passive_target")
+            if self.card is None:
+                return None
+            self._authenticated = None
+            uid = self.card.uid
+            return bytearray([0x01, 0x01, self.card.ATQA >> 8, self.card.ATQA & 0xFF, self.card.SAK, len(uid)]) + uid
+        if command == _COMMAND_INDATAEXCHANGE:
+            data = self._data_exchange(bytes(params[1:]))
+            # Statusbyte 0x01 entspricht einem Timeout der Karte
+            return bytearray([0x01]) if data is None else bytearray([0x00]) + data
+        raise NotImplementedError(f"PN532 Befehl 0x{command:02x} wird nicht simuliert.")
+
+    def _data_exchange(self, frame):
+        card = self.card
+        cmd = frame[0]
+        if isinstance(card, SimulatedNtagCard):
+            return self._ntag_exchange(card, cmd, frame)
+        if cmd in (MIFARE_CMD_AUTH_A, MIFARE_CMD_AUTH_B):
+            self._wait("authenticate")
+            block_number, uid = frame[1], frame[8:12]
+            if card is None or uid != card.uid[:4] or self.rng.random() < self.auth_fail_rate:
+                self._authenticated = None
+                return None
+            self._authenticated = block_number // 4
+            return b""
+        if cmd == MIFARE_CMD_READ:
+            self._wait("read_block")
+            if card is None or self._authenticated != frame[1] // 4:
+                return None
+            return card.blocks[frame[1]]
+        if cmd == MIFARE_CMD_WRITE:
+            self._wait("write_block")
+            if card is None or self._authenticated != frame[1] // 4:
+                return None
+            self._remove_during_write()
+            card.blocks[frame[1]] = bytes(frame[2:18])
+            return b""
+        return None
+
+    def _ntag_exchange(self, card, cmd, frame):
+        if cmd == MIFARE_CMD_READ:
+            self._wait("read_block")
+            return card.read(frame[1])
+        if cmd == NTAG_CMD_FAST_READ:
+            start, end = frame[1], frame[2]
+            if start > end or end >= len(card.pages):
+                return None
+            self._wait("read_block", max(0, (end - start + 1) * 4 - 16))
+            return b"".join(card.pages[start:end + 1])
+        if cmd == NTAG_CMD_GET_VERSION:
+            self._wait("read_block")
+            return bytes([0x00, 0x04, 0x04, 0x02, 0x01, 0x00, card.storage_size, 0x03])
+        if cmd == NTAG_CMD_WRITE:
+            self._wait("write_block")
+            self._remove_during_write()
+            card.pages[frame[1]] = bytes(frame[2:6])
+            return b""
+        return None
+
+    def _remove_during_write(self):
+        if self.rng.random() < self.remove_rate:
+            # Karte wurde während des Schreibens aus dem Feld genommen
+            self.present(None)
+            raise RuntimeError("Did not receive expected ACK from PN532!")
+
+    # High-Level-API von adafruit_pn532
+
+    @property
+    def firmware_version(self):
+        response = self.call_function(_COMMAND_GETFIRMWAREVERSION, 4, timeout=0.5)
+        if response is None:
+            raise RuntimeError("Failed to detect the PN532")
+        return tuple(response)
+
+    def SAM_configuration(self):
+        self.call_function(_COMMAND_SAMCONFIGURATION, params=[0x01, 0x14, 0x01])
+
+    def read_passive_target(self, card_baud=0x00, timeout=1):
+        response = self.call_function(_COMMAND_INLISTPASSIVETARGET, 19, [0x01, card_baud], timeout)
+        if response is None:
+            return None
+        return response[6:6 + response[5]]
+
+    def mifare_classic_authenticate_block(self, uid, block_number, key_number, key):
+        params = bytearray([0x01, key_number & 0xFF, block_number & 0xFF]) + bytes(key) + bytes(uid)[:4]
+        response = self.call_function(_COMMAND_INDATAEXCHANGE, 1, params)
+        return response[0] == 0x00
+
+    def mifare_classic_read_block(self, block_number):
+        response = self.call_function(_COMMAND_INDATAEXCHANGE, 17, [0x01, MIFARE_CMD_READ, block_number & 0xFF])
+        if response[0] != 0x00:
+            return None
+        return response[1:]
+
+    def mifare_classic_write_block(self, block_number, data):
+        params = bytearray([0x01, MIFARE_CMD_WRITE, block_number & 0xFF]) + bytes(data)
+        response = self.call_function(_COMMAND_INDATAEXCHANGE, 1, params)
+        return response[0] == 0x00
+
+    def ntag2xx_read_block(self, block_number):
+        block = self.mifare_classic_read_block(block_number)
+        if block is None:
+            return None
+        return block[0:4]
+
+    def ntag2xx_write_block(self, block_number, data):
+        params = bytearray([0x01, NTAG_CMD_WRITE, block_number & 0xFF]) + bytes(data)
+        response = self.call_function(_COMMAND_INDATAEXCHANGE, 1, params)
+        return response[0] == 0x00
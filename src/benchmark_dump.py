@@ -0,0 +1,52 @@
+# Compare card dump strategies on the simulated PN532 (no hardware needed)
+import os
+import sys
+import time
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nfc_reader import NFCReader, NtagBackend
+from simulated_pn532 import SimulatedCard, SimulatedNtagCard, SimulatedPN532
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROUNDS = 5
+
+
+def ntag_page_by_page(reader, uid):
+    """Baseline: one adafruit ntag2xx_read_block (READ, 3 of 4 pages discarded) per page."""
+    backend = reader._backend
+    return [reader.ntag2xx_read_block(page) for page in range(backend.get_page_count())]
+
+
+def ntag_read_4_pages(reader, uid):
+    backend = reader._backend
+    page_count = backend.get_page_count()
+    return backend.read_pages(0, page_count)
+
+
+def bench(name, card, dump):
+    pn532 = SimulatedPN532(seed=0)
+    reader = NFCReader(pn532)
+    pn532.present(card)
+    uid = reader.detect_card()
+
+    pn532.exchanges = 0
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        if isinstance(reader._backend, NtagBackend):
+            reader._backend.reset()
+        dump(reader, uid)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    logger.info("%-24s %6.1f ms  %4d exchanges per dump", name, elapsed * 1000, pn532.exchanges // ROUNDS)
+
+
+if __name__ == "__main__":
+    bench("classic auth+read", SimulatedCard.random(), NFCReader.read_all_blocks)
+    for card_type in ("ntag213", "ntag215", "ntag216"):
+        card = SimulatedNtagCard.random(card_type=card_type)
+        bench(f"{card_type} page by page", card, ntag_page_by_page)
+        bench(f"{card_type} READ 4 pages", card, ntag_read_4_pages)
+        bench(f"{card_type} FAST_READ", card, NFCReader.read_all_blocks)
@@ -11,14 +11,16 @@ if __name__ == "__main__":
 
     logger.info("Waiting for RFID/NFC card...")
     while True:
-        uid = nfc_reader.read_passive_target(timeout=0.5)
+        uid = nfc_reader.detect_card(timeout=0.5)
         print(".", end="")
         if uid is None:
             continue
-        logger.info("Found card with UID: %s", [hex(i) for i in uid])
+        logger.info("Found %s card with UID: %s", nfc_reader.card_type, [hex(i) for i in uid])
         break
 
     blocks_data = nfc_reader.read_all_blocks(uid)
     for block_number, block_data in enumerate(blocks_data):
         hex_values = " ".join([f"{byte:02x}" for byte in block_data])
         logger.info("Data in Block %d: %s", block_number, hex_values)
+
+    nfc_reader.close()
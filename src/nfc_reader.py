@@ -1,10 +1,7 @@
 # Example how to build a NFCReader that implements an Interface
 from abc import ABC, abstractmethod
-import board
-import busio
-from digitalio import DigitalInOut
-from adafruit_pn532.spi import PN532_SPI
 import logging
+import os
 
 
 # Configure logging
@@ -14,6 +11,40 @@ logger = logging.getLogger("shared_logger")
 DEFAULT_KEY_A = bytes([0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
 BLOCK_COUNT = 64
 
+# PN532 commands used for raw frames (not exposed by adafruit_pn532)
+_COMMAND_INDATAEXCHANGE = 0x40
+_COMMAND_INLISTPASSIVETARGET = 0x4A
+
+# NTAG21x / Ultralight card commands
+NTAG_CMD_READ = 0x30
+NTAG_CMD_FAST_READ = 0x3A
+NTAG_CMD_GET_VERSION = 0x60
+NTAG_PAGE_SIZE = 4
+NTAG_PAGES_PER_READ = 4
+# FAST_READ answer must fit into one PN532 frame (max. 262 bytes incl. header)
+NTAG_FAST_READ_MAX_PAGES = 60
+# Total page count by storage size byte of GET_VERSION
+NTAG_PAGE_COUNT = {
+    0x0B: 20,   # Ultralight EV1 MF0UL11
+    0x0E: 41,   # Ultralight EV1 MF0UL21
+    0x0F: 45,   # NTAG213
+    0x11: 135,  # NTAG215
+    0x13: 231,  # NTAG216
+}
+ULTRALIGHT_PAGE_COUNT = 16
+
+CARD_MIFARE_CLASSIC = "mifare_classic"
+CARD_NTAG = "ntag"
+
+
+def detect_card_type(atqa, sak):
+    """Determine the card family from ATQA (SENS_RES) and SAK (SEL_RES)."""
+    if sak in (0x08, 0x18, 0x09, 0x88):
+        return CARD_MIFARE_CLASSIC
+    if sak == 0x00 and atqa == 0x0044:
+        return CARD_NTAG
+    return None
+
 
 class NFCReaderInterface(ABC):
 
@@ -36,33 +67,13 @@ class NFCReaderInterface(ABC):
         pass
 
 
-class NFCReader(NFCReaderInterface):
-    def __init__(self):
-        self._pn532 = self.config()
-
-    def __getattr__(self, name):
-        """
-        Delegate any call to PN532_SPI if it's not explicitly defined in NFCReader.
-        """
-        return getattr(self._pn532, name)
-    # TODO: add logging config
-    def add_logger(self, filepath : str):
-        pass
-    def config(self):
-        try:
-            spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
-            cs_pin = DigitalInOut(board.D8)
-            pn532 = PN532_SPI(spi, cs_pin, debug=False)
+class MifareClassicBackend:
+    """MIFARE Classic 1K: 16-byte blocks, every access authenticates with key A."""
 
-            ic, ver, rev, support = pn532.firmware_version
-            logger.info("Found PN532 with firmware version: %d.%d", ver, rev)
+    block_size = 16
 
-            # Configure PN532 to communicate with MiFare cards
-            pn532.SAM_configuration()
-            return pn532
-        except Exception as e:
-            logger.error("Failed to configure PN532: %s", e)
-            raise
+    def __init__(self, pn532):
+        self._pn532 = pn532
 
     def read_block(self, uid, block_number):
         try:
@@ -95,20 +106,6 @@ class NFCReader(NFCReaderInterface):
 
     def write_block(self, uid, block_number, data):
         try:
-            # Validate `uid` type
-            if not isinstance(uid, bytes):
-                logger.error("UID must be of type 'bytes'. Provided type: %s", type(uid))
-                return False
-
-            # Validate `data` type and length
-            if not isinstance(data, bytes) or len(data) != 16:
-                logger.error(
-                    "Data must be a 'bytes' object of exactly 16 bytes. Provided: type=%s, length=%d",
-                    type(data),
-                    len(data) if isinstance(data, bytes) else 0,
-                )
-                return False
-        
             authenticated = self._pn532.mifare_classic_authenticate_block(
                 uid, block_number, 0x60, key=DEFAULT_KEY_A
             )
@@ -127,49 +124,249 @@ class NFCReader(NFCReaderInterface):
             logger.exception("Error writing block %d: %s", block_number, e)
             return False
 
-    def write_block(self, uid, block_number, data):
+
+class NtagBackend:
+    """
+    NTAG21x / Ultralight: 4-byte pages, no authentication.
+    A block is one page. READ returns 4 pages at once, FAST_READ a whole page range.
+    """
+
+    block_size = NTAG_PAGE_SIZE
+
+    def __init__(self, pn532):
+        self._pn532 = pn532
+        self.page_count = None
+        self.supports_fast_read = False
+
+    def _exchange(self, frame, response_length):
+        """Send a raw card command via InDataExchange, returns the card answer or None."""
+        response = self._pn532.call_function(
+            _COMMAND_INDATAEXCHANGE, params=[0x01] + list(frame), response_length=response_length + 1
+        )
+        if not response or response[0] & 0x3F != 0x00:
+            return None
+        return bytes(response[1:])
+
+    def reset(self):
+        """Forget the memory layout of the previous card."""
+        self.page_count = None
+        self.supports_fast_read = False
+
+    def get_page_count(self):
+        """Read the memory size once with GET_VERSION, plain Ultralight does not support it."""
+        if self.page_count is None:
+            version = self._exchange([NTAG_CMD_GET_VERSION], 8)
+            if version and len(version) == 8:
+                self.page_count = NTAG_PAGE_COUNT.get(version[6], ULTRALIGHT_PAGE_COUNT)
+                self.supports_fast_read = True
+            else:
+                # The NAK puts a plain Ultralight back to IDLE, select it again
+                self._pn532.read_passive_target(timeout=0.5)
+                self.page_count = ULTRALIGHT_PAGE_COUNT
+        return self.page_count
+
+    def read_pages(self, start_page, count):
+        """Read count pages with one READ per 4 pages, returns the raw bytes or None."""
+        data = bytearray()
+        for page in range(start_page, start_page + count, NTAG_PAGES_PER_READ):
+            chunk = self._exchange([NTAG_CMD_READ, page], NTAG_PAGES_PER_READ * NTAG_PAGE_SIZE)
+            if chunk is None:
+                logger.error("Failed to read pages %d-%d", page, page + NTAG_PAGES_PER_READ - 1)
+                return None
+            data += chunk
+        return bytes(data[:count * NTAG_PAGE_SIZE])
+
+    def fast_read(self, start_page, end_page):
+        """Read pages start_page..end_page (inclusive) with FAST_READ, split only at the PN532 frame limit."""
+        data = bytearray()
+        for page in range(start_page, end_page + 1, NTAG_FAST_READ_MAX_PAGES):
+            last = min(page + NTAG_FAST_READ_MAX_PAGES - 1, end_page)
+            chunk = self._exchange([NTAG_CMD_FAST_READ, page, last], (last - page + 1) * NTAG_PAGE_SIZE)
+            if chunk is None:
+                logger.warning("FAST_READ of pages %d-%d failed", page, last)
+                return None
+            data += chunk
+        return bytes(data)
+
+    def read_block(self, uid, block_number):
         try:
-            authenticated = self._pn532.mifare_classic_authenticate_block(
-                uid, block_number, 0x60, key=DEFAULT_KEY_A
-            )
-            if not authenticated:
-                logger.error("Failed to authenticate block %d for writing", block_number)
-                return False
+            page_data = self.read_pages(block_number, 1)
+            if page_data is None:
+                logger.error("Failed to read page %d", block_number)
+            return page_data
+        except Exception as e:
+            logger.exception("Error reading page %d: %s", block_number, e)
+            return None
 
-            success = self._pn532.mifare_classic_write_block(block_number, data)
+    def read_all_blocks(self, uid):
+        try:
+            page_count = self.get_page_count()
+            if self.supports_fast_read:
+                data = self.fast_read(0, page_count - 1)
+            else:
+                data = self.read_pages(0, page_count)
+            if data is None:
+                return []
+            return [data[i:i + NTAG_PAGE_SIZE] for i in range(0, len(data), NTAG_PAGE_SIZE)]
+        except Exception as e:
+            logger.exception("Error reading pages: %s", e)
+            return []
+
+    def write_block(self, uid, block_number, data):
+        try:
+            success = self._pn532.ntag2xx_write_block(block_number, data)
             if not success:
-                logger.error("Failed to write to block %d", block_number)
+                logger.error("Failed to write to page %d", block_number)
                 return False
 
-            logger.info("Successfully wrote data to block %d", block_number)
+            logger.info("Successfully wrote data to page %d", block_number)
             return True
         except Exception as e:
-            logger.exception("Error writing block %d: %s", block_number, e)
+            logger.exception("Error writing page %d: %s", block_number, e)
+            return False
+
+
+BACKENDS = {
+    CARD_MIFARE_CLASSIC: MifareClassicBackend,
+    CARD_NTAG: NtagBackend,
+}
+
+
+class NFCReader(NFCReaderInterface):
+    def __init__(self, pn532=None, trace_path=None):
+        self._pn532 = pn532 if pn532 is not None else self.config()
+
+        # Record all PN532 frames, e.g. PN532_TRACE=dump.trace python main.py
+        trace_path = trace_path or os.environ.get("PN532_TRACE")
+        self.trace_recorder = None
+        if trace_path:
+            # pn532_trace.py lives in the repository root
+            from pn532_trace import TraceRecorder
+            self.trace_recorder = TraceRecorder(trace_path)
+            self.trace_recorder.attach(self._pn532)
+        self.card_type = CARD_MIFARE_CLASSIC
+        self._backend = MifareClassicBackend(self._pn532)
+
+    def __getattr__(self, name):
+        """
+        Delegate any call to PN532_SPI if it's not explicitly defined in NFCReader.
+        """
+        return getattr(self._pn532, name)
+    def close(self):
+        """Close the trace file if frames are being recorded."""
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+            self.trace_recorder = None
+
+    # TODO: add logging config
+    def add_logger(self, filepath : str):
+        pass
+    def config(self):
+        import board
+        import busio
+        from digitalio import DigitalInOut
+        from adafruit_pn532.spi import PN532_SPI
+
+        try:
+            spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
+            cs_pin = DigitalInOut(board.D8)
+            pn532 = PN532_SPI(spi, cs_pin, debug=False)
+
+            ic, ver, rev, support = pn532.firmware_version
+            logger.info("Found PN532 with firmware version: %d.%d", ver, rev)
+
+            # Configure PN532 to communicate with MiFare cards
+            pn532.SAM_configuration()
+            return pn532
+        except Exception as e:
+            logger.error("Failed to configure PN532: %s", e)
+            raise
+
+    def detect_card(self, timeout=0.5):
+        """
+        Wait for a card like read_passive_target, but also evaluate ATQA/SAK and
+        select the matching backend. Returns the UID or None.
+        """
+        response = self._pn532.call_function(
+            _COMMAND_INLISTPASSIVETARGET, params=[0x01, 0x00], response_length=19, timeout=timeout
+        )
+        if response is None or response[0] != 0x01:
+            return None
+
+        atqa = (response[2] << 8) | response[3]
+        sak = response[4]
+        uid = bytes(response[6:6 + response[5]])
+
+        card_type = detect_card_type(atqa, sak)
+        if card_type is None:
+            logger.warning("Unknown card type (ATQA 0x%04x, SAK 0x%02x), using MIFARE Classic", atqa, sak)
+            card_type = CARD_MIFARE_CLASSIC
+        if card_type != self.card_type:
+            self._backend = BACKENDS[card_type](self._pn532)
+            self.card_type = card_type
+        elif card_type == CARD_NTAG:
+            # New card, memory size may differ
+            self._backend.reset()
+        logger.info("Detected %s card (ATQA 0x%04x, SAK 0x%02x)", card_type, atqa, sak)
+        return uid
+
+    @property
+    def block_size(self):
+        return self._backend.block_size
+
+    def read_block(self, uid, block_number):
+        return self._backend.read_block(uid, block_number)
+
+    def read_all_blocks(self, uid):
+        return self._backend.read_all_blocks(uid)
+
+    def write_block(self, uid, block_number, data):
+        # Validate `uid` type
+        if not isinstance(uid, (bytes, bytearray)):
+            logger.error("UID must be of type 'bytes'. Provided type: %s", type(uid))
+            return False
+
+        # Validate `data` type and length
+        if not isinstance(data, (bytes, bytearray)) or len(data) != self.block_size:
+            logger.error(
+                "Data must be a 'bytes' object of exactly %d bytes. Provided: type=%s, length=%d",
+                self.block_size,
+                type(data),
+                len(data) if isinstance(data, (bytes, bytearray)) else 0,
+            )
             return False
 
+        return self._backend.write_block(uid, block_number, data)
+
 if __name__ == "__main__":
 
     nfc_reader = NFCReader()
 
     logger.info("Waiting for RFID/NFC card...")
     while True:
-        uid = nfc_reader.read_passive_target(timeout=0.5)
+        uid = nfc_reader.detect_card(timeout=0.5)
         print(".", end="")
         if uid is None:
             continue
-        logger.info("Found card with UID: %s", [hex(i) for i in uid])
+        logger.info("Found %s card with UID: %s", nfc_reader.card_type, [hex(i) for i in uid])
         break
 
     uid_bytes = bytes(uid)
-    uid_16 = bytes([
-    0x93, 0x5f, 0xa7, 0x91,  # First 4 bytes
-    0x01, 0x02, 0x03, 0x04,  # Next 4 bytes
-    0x05, 0x06, 0x07, 0x08,  # Next 4 bytes
-    0x09, 0x0A, 0x0B, 0x0C   # Last 4 bytes
-    ])
-    nfc_reader.write_block(uid = uid_bytes, block_number = 2, data = uid_16)
-    
+    if nfc_reader.card_type == CARD_NTAG:
+        # Page 4 is the first user page on NTAG21x
+        nfc_reader.write_block(uid = uid_bytes, block_number = 4, data = bytes([0x93, 0x5f, 0xa7, 0x91]))
+    else:
+        uid_16 = bytes([
+        0x93, 0x5f, 0xa7, 0x91,  # First 4 bytes
+        0x01, 0x02, 0x03, 0x04,  # Next 4 bytes
+        0x05, 0x06, 0x07, 0x08,  # Next 4 bytes
+        0x09, 0x0A, 0x0B, 0x0C   # Last 4 bytes
+        ])
+        nfc_reader.write_block(uid = uid_bytes, block_number = 2, data = uid_16)
+
     blocks_data = nfc_reader.read_all_blocks(uid)
     for block_number, block_data in enumerate(blocks_data):
         hex_values = " ".join([f"{byte:02x}" for byte in block_data])
         logger.info("Data in Block %d: %s", block_number, hex_values)
+
+    nfc_reader.close()
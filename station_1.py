@@ -1,26 +1,39 @@
 import time
 import sqlite3
 import logging
+import argparse
+import retry_queue
 from rfid_handler import RFIDHandler
+from replica import StationReplica, init_station_claim, SYNC_INTERVAL
+from handoff import HandoffPublisher
 
-# Logger konfigurieren
-logging.basicConfig(filename='station1.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 DB_PATH = 'data/flaschen_database.db'
 
-def write_flaschen_id():
-    rfid_handler = RFIDHandler()
-    conn = sqlite3.connect(DB_PATH)
+def write_flaschen_id(publisher=None, rfid_handler=None, db_path=DB_PATH):
+    """
+    Taggt die nächste ungetaggte Flasche. Gibt die Flaschen-ID zurück, False bei einem Fehler
+    und None, wenn keine ungetaggte Flasche mehr vorhanden ist.
+    """
+    own_handler = rfid_handler is None
+    rfid_handler = rfid_handler or RFIDHandler()
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    result = False
 
     try:
-        # Erste ungetaggte Flasche abrufen
-        cursor.execute("SELECT Flaschen_ID FROM Flasche WHERE Tagged_Date = 0 LIMIT 1;")
-        result = cursor.fetchone()
+        # Erste ungetaggte Flasche abrufen, die keine Station mit lokaler Kopie reserviert hat
+        cursor.execute("""
+            SELECT f.Flaschen_ID FROM Flasche f
+            WHERE f.Tagged_Date = 0
+              AND NOT EXISTS (SELECT 1 FROM Station_Claim c WHERE c.Flaschen_ID = f.Flaschen_ID)
+            LIMIT 1;
+        """)
+        row = cursor.fetchone()
 
-        if result:
-            flaschen_id = result[0]
+        if row:
+            flaschen_id = row[0]
             logger.info(f"Ungetaggte Flasche gefunden: {flaschen_id}")
 
             # Flaschen-ID auf die Karte schreiben
@@ -33,16 +46,112 @@ def write_flaschen_id():
                 )
                 conn.commit()
                 logger.info(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben und getagged.")
+                if publisher:
+                    publisher.publish(flaschen_id, current_timestamp)
+                result = flaschen_id
             else:
                 logger.error("Fehler beim Schreiben der Flaschen-ID auf die Karte.")
         else:
             logger.warning("Keine ungetaggte Flasche in der Datenbank gefunden.")
+            result = None
 
     except Exception as e:
         logger.error(f"Fehler in station1.py: {e}")
 
     finally:
         conn.close()
+        if own_handler:
+            rfid_handler.close()
+    return result
+
+def write_flaschen_id_replica(replica, publisher=None, rfid_handler=None):
+    """
+    Wie write_flaschen_id, arbeitet aber nur auf der lokalen Stationskopie.
+    Den Abgleich mit dem Master übernimmt der Sync-Thread der Kopie. Fehlversuche laufen wie in
+    main.py über die Retry-Queue (hier in der lokalen Kopie), nach MAX_ATTEMPTS wird die Flasche
+    per set_error ausgesondert und der Fehler mit dem Master synchronisiert.
+    """
+    rfid_handler = rfid_handler or RFIDHandler()
+
+    flaschen_id = retry_queue.next_bottle(replica.conn)
+    if flaschen_id is None:
+        logger.warning("Keine reservierte ungetaggte Flasche in der lokalen Kopie.")
+        return None
+
+    logger.info(f"Ungetaggte Flasche gefunden: {flaschen_id}")
+    try:
+        written = rfid_handler.write_flaschen_id(flaschen_id)
+        error = "Fehler beim Schreiben der Flaschen-ID auf die Karte."
+    except RuntimeError as e:
+        # z.B. Karte während des Schreibens entfernt
+        written = False
+        error = f"Kommunikationsfehler: {e}"
+
+    if written:
+        replica.mark_tagged(flaschen_id)
+        retry_queue.record_success(replica.conn, flaschen_id)
+        logger.info(f"Flaschen-ID {flaschen_id} erfolgreich geschrieben und lokal getagged.")
+        if publisher:
+            publisher.publish(flaschen_id)
+        return flaschen_id
+    if rfid_handler.last_uid is None:
+        # Keine Karte im Feld ist kein Fehlversuch
+        return False
+    logger.error(error)
+    if retry_queue.record_failure(replica.conn, flaschen_id, error) == retry_queue.STATUS_DEAD:
+        replica.set_error(flaschen_id)
+    return False
+
+
+def run_replica_station(replica, publisher=None):
+    """Taggt fortlaufend aus der lokalen Kopie, bis die Station beendet wird (Strg+C)."""
+    rfid_handler = RFIDHandler()
+    retry_queue.init_retry_queue(replica.conn)
+    if replica.next_bottle() is None:
+        # Erster Start: Vorrat direkt holen, bei nicht erreichbarem Master übernimmt das der Sync-Thread
+        try:
+            replica.refresh_recipes()
+            replica.claim_bottles()
+        except sqlite3.Error as e:
+            logger.warning(f"Master nicht erreichbar, Sync-Thread reserviert Flaschen nach: {e}")
+    replica.start_sync()
+
+    try:
+        while True:
+            # Leeres Band: weiter auf eine Karte warten, ohne Datenbankzugriff
+            if rfid_handler.read_uid() is None:
+                continue
+            if write_flaschen_id_replica(replica, publisher, rfid_handler) is None:
+                # Vorrat leer: auf den nächsten Durchlauf des Sync-Threads warten
+                time.sleep(SYNC_INTERVAL)
+                continue
+            # Ein Versuch je aufgelegter Karte: die nächste ID erst auf eine andere Karte schreiben
+            if rfid_handler.last_uid is not None:
+                rfid_handler.wait_for_removal(rfid_handler.last_uid)
+    except KeyboardInterrupt:
+        logger.info("Station 1 beendet.")
+    finally:
+        rfid_handler.close()
 
 if __name__ == "__main__":
-    write_flaschen_id()
+    # Logger konfigurieren
+    logging.basicConfig(filename='station1.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replica", metavar="STATION_ID", help="Lokale Stationskopie statt Master-Datenbank verwenden")
+    args = parser.parse_args()
+
+    publisher = HandoffPublisher()
+    if args.replica:
+        replica = StationReplica(args.replica, f"data/station_{args.replica}.db", DB_PATH)
+        try:
+            run_replica_station(replica, publisher)
+        finally:
+            # Einmaliger Abgleich beim Beenden, offene Änderungen bleiben sonst lokal bis zum nächsten Start
+            replica.close()
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        init_station_claim(conn)
+        conn.close()
+        write_flaschen_id(publisher)
+    publisher.close()
@@ -1,19 +1,16 @@
+import time
 import logging
+import argparse
 from rfid_handler import RFIDHandler
+from handoff import RecipePrefetcher
+from reporting import ensure_dispensed_column
 import sqlite3
 
-# Logging konfigurieren
-logging.basicConfig(
-    filename="station2.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
 DB_PATH = "data/flaschen_database.db"
 
-def get_rezept_for_flasche(flaschen_id):
+def get_rezept_for_flasche(flaschen_id, db_path=DB_PATH):
     """Holt die Rezeptdaten für eine gegebene Flaschen-ID aus der Datenbank."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Rezeptdaten aus der Datenbank abrufen
@@ -34,19 +31,83 @@ def get_rezept_for_flasche(flaschen_id):
     logging.info(f"Rezeptdaten für Flaschen-ID {flaschen_id} abgerufen: {rows}")
     return rows
 
-if __name__ == "__main__":
-    rfid_handler = RFIDHandler()
+def mark_dispensed(flaschen_id, db_path=DB_PATH):
+    """Speichert den Zeitpunkt der Abfüllung, Grundlage für den dispense-latency Report."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE Flasche SET Dispensed_Date = ? WHERE Flaschen_ID = ?;",
+        (int(time.time()), flaschen_id),
+    )
+    conn.commit()
+    conn.close()
+
+def process_bottle(rfid_handler, get_rezept=get_rezept_for_flasche):
+    """Liest eine Karte und gibt das Rezept der Flasche aus."""
+    start = time.perf_counter()
 
     # Lese die Flaschen-ID von der Karte
     flaschen_id = rfid_handler.read_flaschen_id()
     if flaschen_id is not None:
         logging.info(f"Flaschen-ID gelesen: {flaschen_id}")
-        rezeptdaten = get_rezept_for_flasche(flaschen_id)
+        rezeptdaten = get_rezept(flaschen_id)
+        logging.info(f"Antwortzeit für Flaschen-ID {flaschen_id}: {(time.perf_counter() - start) * 1000:.1f} ms")
         if rezeptdaten:
             print(f"Rezeptdaten für Flaschen-ID {flaschen_id}:")
             for rezept_id, granulat_id, menge in rezeptdaten:
                 print(f"  Rezept ID: {rezept_id}, Granulat ID: {granulat_id}, Menge: {menge}g")
+            mark_dispensed(flaschen_id)
         else:
             print(f"Keine Rezeptdaten für Flaschen-ID {flaschen_id} gefunden.")
     else:
         logging.error("Keine Flaschen-ID von der Karte gelesen.")
+
+def process_bottles(rfid_handler, get_rezept=get_rezept_for_flasche):
+    """
+    Arbeitet Flaschen fortlaufend ab. Jede Karte wird nur einmal verarbeitet, auch wenn die Flasche
+    länger als einen Zyklus unter dem Leser steht; die nächste Flasche erst nach dem Entfernen.
+    """
+    while True:
+        # Leeres Band: auf eine Karte warten, ohne Fehlermeldung pro Zyklus
+        if rfid_handler.read_uid() is None:
+            continue
+        process_bottle(rfid_handler, get_rezept)
+        if rfid_handler.last_uid is not None:
+            rfid_handler.wait_for_removal(rfid_handler.last_uid)
+
+if __name__ == "__main__":
+    # Logging konfigurieren
+    logging.basicConfig(
+        filename="station2.log",
+        level=logging.DEBUG,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loop", action="store_true",
+                        help="Flaschen fortlaufend abarbeiten und Rezepte aus der Übergabe von Station 1 vorab laden")
+    args = parser.parse_args()
+
+    # Spalte Dispensed_Date einmalig beim Start nachrüsten, nicht pro Flasche
+    conn = sqlite3.connect(DB_PATH)
+    ensure_dispensed_column(conn)
+    conn.close()
+
+    rfid_handler = RFIDHandler()
+
+    try:
+        if args.loop:
+            prefetcher = RecipePrefetcher(get_rezept_for_flasche)
+            prefetcher.start()
+            try:
+                process_bottles(rfid_handler, prefetcher.get)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                prefetcher.stop()
+                logging.info(f"Vorabladen: {prefetcher.stats()}")
+                print(f"Vorabladen: {prefetcher.stats()}")
+        else:
+            process_bottle(rfid_handler)
+    finally:
+        rfid_handler.close()